@@ -96,17 +96,34 @@ def get_parser():
         description=help.install_description,
         formatter_class=argparse.RawTextHelpFormatter,
     )
-    install.add_argument("install_recipe", help="recipe to install")
-
     install.add_argument(
-        "container_image",
-        help="path to an existing container image for this software",
-        nargs="?",
+        "install_recipe",
+        help="recipe(s) to install",
+        nargs="*",
+    )
+    install.add_argument(
+        "--container-image",
+        dest="container_image",
+        help="path to an existing container image, when installing one recipe",
+        default=None,
+    )
+    install.add_argument(
+        "--file",
+        dest="recipe_file",
+        help="file with recipes to install, one per line",
+        default=None,
+    )
+    install.add_argument(
+        "--jobs",
+        "-j",
+        help="when installing more than one recipe, pull this many containers at once (defaults to 1).",
+        default=1,
+        type=int,
     )
 
     install.add_argument(
         "--keep-path",
-        help="if installing a local container, do not copy the container - use the provided path.",
+        help="if installing a local container (one recipe with --container-image), do not copy the container - use the provided path.",
         default=False,
         action="store_true",
     )
@@ -229,7 +246,36 @@ def get_parser():
         formatter_class=argparse.RawTextHelpFormatter,
         description=help.check_description,
     )
-    check.add_argument("module_name", help="module to check (module:version)")
+    check.add_argument(
+        "module_name", help="module to check (module:version)", nargs="?"
+    )
+    check.add_argument(
+        "--all",
+        "-a",
+        dest="check_all",
+        help="check all installed modules and tags.",
+        default=False,
+        action="store_true",
+    )
+    check.add_argument(
+        "--jobs",
+        "-j",
+        help="with --all, check this many modules at once (defaults to 1).",
+        default=1,
+        type=int,
+    )
+    check.add_argument(
+        "--remote",
+        help="with --all, also resolve the current digest of each tag upstream.",
+        default=False,
+        action="store_true",
+    )
+    check.add_argument(
+        "--json", help="print the report as json", default=False, action="store_true"
+    )
+    check.add_argument(
+        "--out", "-o", help="save the json report to this file.", default=None
+    )
 
     view = subparsers.add_parser(
         "view",
@@ -380,6 +426,19 @@ def get_parser():
         default=False,
         action="store_true",
     )
+    upgrade.add_argument(
+        "--jobs",
+        "-j",
+        help="with --all, pull this many containers at once (defaults to 1).",
+        default=1,
+        type=int,
+    )
+    upgrade.add_argument(
+        "--json",
+        help="with --all --dry-run, print the upgrade plan as json.",
+        default=False,
+        action="store_true",
+    )
 
     # Update gets latest tags from OCI registries
     update = subparsers.add_parser(
@@ -397,6 +456,13 @@ def get_parser():
         help="ignore container.yaml filters, run an update with this specific set",
         dest="filters",
     )
+    update.add_argument(
+        "--jobs",
+        "-j",
+        help="look up this many tag digests at once (defaults to 8).",
+        default=8,
+        type=int,
+    )
 
     # sync-registry gets latest files and non-existing containers from upstream shpc
     sync = subparsers.add_parser(
@@ -427,6 +493,13 @@ def get_parser():
         default=False,
         action="store_true",
     )
+    sync.add_argument(
+        "--jobs",
+        "-j",
+        help="With --config-file, sync up to this many registries at once (defaults to 1).",
+        default=1,
+        type=int,
+    )
     sync.add_argument(
         "--existing-only",
         help="Do not add recipes that are not found in the local repository (only sync existing).",
@@ -476,6 +549,18 @@ def get_parser():
             default=None,
         )
 
+    inventory = subparsers.add_parser(
+        "inventory",
+        description=help.inventory_description,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    inventory.add_argument(
+        "action",
+        help="rebuild the inventory from the module tree",
+        nargs="?",
+        choices=["rebuild"],
+    )
+
     namespace = subparsers.add_parser(
         "namespace",
         description=help.namespace_description,
@@ -487,6 +572,49 @@ def get_parser():
         nargs="*",
     )
 
+    validate = subparsers.add_parser(
+        "validate",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=help.validate_description,
+    )
+    validate.add_argument(
+        "--jobs",
+        "-j",
+        help="validate files in this many processes (defaults to 1).",
+        default=1,
+        type=int,
+    )
+    validate.add_argument(
+        "--all",
+        "-a",
+        dest="force",
+        help="validate all files, including unchanged files that passed before.",
+        default=False,
+        action="store_true",
+    )
+    validate.add_argument(
+        "--json", help="print the report as json", default=False, action="store_true"
+    )
+    validate.add_argument(
+        "--out", "-o", help="save the json report to this file.", default=None
+    )
+
+    search = subparsers.add_parser(
+        "search",
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=help.search_description,
+    )
+    search.add_argument(
+        "query", help="terms to search names, aliases and descriptions for", nargs="+"
+    )
+    search.add_argument(
+        "-l",
+        "--limit",
+        help="set a limit for the number of results to show",
+        default=None,
+        type=int,
+    )
+
     show = subparsers.add_parser(
         "show",
         formatter_class=argparse.RawTextHelpFormatter,
@@ -505,6 +633,12 @@ def get_parser():
         default=None,
         dest="filter_string",
     )
+    show.add_argument(
+        "--json-lines",
+        help="show one json object per entry (name, path, and versions with --versions)",
+        default=False,
+        action="store_true",
+    )
     show.add_argument(
         "-l",
         "--limit",
@@ -513,7 +647,7 @@ def get_parser():
         type=int,
     )
 
-    for command in docgen, show, add, remove, sync:
+    for command in docgen, show, search, validate, add, remove, sync:
         command.add_argument(
             "--registry", help="GitHub repository or local path where registry lives."
         )
@@ -586,6 +720,8 @@ def run_shpc():
         from .install import main
     elif args.command == "inspect":
         from .inspect import main
+    elif args.command == "inventory":
+        from .inventory import main
     elif args.command == "list":
         from .listing import main
     elif args.command == "namespace":
@@ -598,10 +734,14 @@ def run_shpc():
         from .reinstall import main
     elif args.command == "shell":
         from .shell import main
+    elif args.command == "search":
+        from .search import main
     elif args.command == "show":
         from .show import main
     elif args.command == "test":
         from .test import main
+    elif args.command == "validate":
+        from .validate import main
     elif args.command == "view":
         from .view import main
     elif args.command == "uninstall":
@@ -2,7 +2,10 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+import sys
+
 import shpc.utils
+from shpc.logger import logger
 
 
 def main(args, parser, extra, subparser):
@@ -19,4 +22,17 @@ def main(args, parser, extra, subparser):
 
     # Update config settings on the fly
     cli.settings.update_params(args.config_params)
+
+    if args.check_all:
+        if args.module_name:
+            logger.exit("You cannot specify a module with --all.")
+        report = cli.check_all(
+            jobs=args.jobs, remote=args.remote, out=args.out, as_json=args.json
+        )
+        if report["total"] != report["up-to-date"]:
+            sys.exit(1)
+        return
+
+    if not args.module_name:
+        subparser.error("Please provide a module to check, or --all.")
     cli.check(args.module_name)
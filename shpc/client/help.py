@@ -37,6 +37,9 @@ install_description = """Install a registry recipe.
 
   # Install a specific version from that set
   $ shpc install python:3.9.5-alpine
+
+  # Install several recipes (or --file with one per line), pulling 4 at once
+  $ shpc install python:3.9.5-alpine quay.io/biocontainers/samtools --jobs 4
 """
 
 reinstall_description = """Reinstall a software. Containers are kept by default
@@ -134,6 +137,9 @@ check_description = """Check if you have latest installed.
 
   # Check to see if we have the latest tag installed for python
   $ shpc check python
+
+  # Check all installed modules, resolving current digests upstream 8 at a time
+  $ shpc check --all --remote --jobs 8 --out report.json
 """
 
 view_description = """View control to create, install, and uninstall A view name is always required.
@@ -232,6 +238,9 @@ update_description = """Update a container recipe with new versions. The actual
 
   # Update all local container yaml recipes
   $ shpc update
+
+  # Look up 16 tag digests at once
+  $ shpc update quay.io/biocontainers/samtools --jobs 16
 """
 
 sync_description = """Get latest files and containers from an upstream shpc. This is only supported to run against a filesystem (local) registry.
@@ -255,6 +264,15 @@ sync_description = """Get latest files and containers from an upstream shpc. Thi
   $ shpc sync-registry --registry ./registry --dry-run
 """
 
+inventory_description = """Show or rebuild the inventory of installed modules
+
+  # Show installed modules, tags, containers and views as json
+  $ shpc inventory
+
+  # Rebuild the inventory from the module tree (e.g., after manual changes)
+  $ shpc inventory rebuild
+"""
+
 namespace_description = """Set or unset the install namespace.
 
   # Use the ghcr.io/autamus namespace
@@ -267,6 +285,27 @@ namespace_description = """Set or unset the install namespace.
   $ shpc namespace unset
 """
 
+search_description = """Search registry entries by name, alias, description, url or tag
+
+  # Find containers that provide samtools
+  $ shpc search samtools
+
+  # All terms must match, and the best matches are shown first
+  $ shpc search sequence alignment --limit 10
+"""
+
+validate_description = """Validate the container.yaml files in filesystem registries
+
+  # Validate changed files in the registries from your settings
+  $ shpc validate
+
+  # Validate every file (including unchanged files that passed) with 8 processes
+  $ shpc validate --all --jobs 8
+
+  # Save a json report for CI
+  $ shpc validate --registry ./registry --out report.json
+"""
+
 show_description = """Show the config for a registry entry
 
   # Show all modules available for the remote registry (or targeted from your settings.yml config)
@@ -280,6 +319,9 @@ show_description = """Show the config for a registry entry
 
   # Filter all modules to those with "python"
   $ shpc show --filter python
+
+  # Stream one json object per line to another tool
+  $ shpc show --versions --json-lines | jq .name
 """
 
 upgrade_description = """Upgrade software to the latest version.
@@ -293,6 +335,12 @@ upgrade_description = """Upgrade software to the latest version.
       OR
   $ shpc upgrade -a
 
+  # Upgrade all software, pulling 4 containers at once
+  $ shpc upgrade --all --jobs 4
+
+  # Show the upgrade plan for all software as json, without upgrading
+  $ shpc upgrade --all --dry-run --json
+
   # Valid arguement combinations:
   # Perform dry-run on a software to check if the latest is installed or not without upgrading it.
   $ shpc upgrade quay.io/biocontainers/samtools --dry-run
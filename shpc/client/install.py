@@ -2,7 +2,11 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+import os
+import sys
+
 import shpc.utils
+from shpc.logger import logger
 
 
 def main(args, parser, extra, subparser):
@@ -10,7 +14,32 @@ def main(args, parser, extra, subparser):
 
     shpc.utils.ensure_no_extra(extra)
 
-    if args.install_recipe.startswith("gh://"):
+    recipes = list(args.install_recipe)
+    container_image = args.container_image
+
+    # Older usage gave the container image after the recipe
+    if not container_image and len(recipes) == 2 and os.path.isfile(recipes[1]):
+        logger.warning(
+            "Giving a container image after the recipe is deprecated, use --container-image."
+        )
+        container_image = recipes.pop()
+
+    if args.recipe_file:
+        for line in shpc.utils.read_file(args.recipe_file).splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line:
+                recipes.append(line)
+    if not recipes:
+        logger.exit("Please provide one or more recipes to install.")
+    if len(recipes) > 1:
+        for option, value in [
+            ("--container-image", container_image),
+            ("--keep-path", args.keep_path),
+        ]:
+            if value:
+                logger.exit("%s can only be used to install one recipe." % option)
+
+    if recipes[0].startswith("gh://"):
         args.container_tech = "singularity-deploy"
 
     cli = get_client(
@@ -23,17 +52,29 @@ def main(args, parser, extra, subparser):
     # Update config settings on the fly
     cli.settings.update_params(args.config_params)
 
+    # A unique short name (e.g., samtools) can be used for the full name
+    recipes = [cli.resolve_name(recipe) for recipe in recipes]
+
     # And do the install
-    cli.install(
-        args.install_recipe,
-        force=args.force,
-        container_image=args.container_image,
-        keep_path=args.keep_path,
-    )
-    if cli.settings.default_view and not args.no_view:
-        cli.view_install(
-            cli.settings.default_view,
-            args.install_recipe,
+    if len(recipes) == 1:
+        cli.install(
+            recipes[0],
             force=args.force,
-            container_image=args.container_image,
+            container_image=container_image,
+            keep_path=args.keep_path,
         )
+        installed = recipes
+    else:
+        results = cli.install_many(recipes, jobs=args.jobs, force=args.force)
+        installed = [name for name, result in results.items() if result == "installed"]
+
+    if cli.settings.default_view and not args.no_view:
+        for recipe in installed:
+            cli.view_install(
+                cli.settings.default_view,
+                recipe,
+                force=args.force,
+                container_image=container_image,
+            )
+    if len(installed) != len(recipes):
+        sys.exit(1)
@@ -0,0 +1,32 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import shpc.utils
+from shpc.logger import logger
+
+
+def main(args, parser, extra, subparser):
+    from shpc.main import get_client
+
+    shpc.utils.ensure_no_extra(extra)
+
+    cli = get_client(quiet=args.quiet, settings_file=args.settings_file)
+
+    # Update config settings on the fly
+    cli.settings.update_params(args.config_params)
+
+    if args.action == "rebuild":
+        modules = cli.inventory.rebuild()
+        if not cli.inventory.exists():
+            logger.exit("Cannot write inventory %s." % cli.inventory.path)
+        count = sum(len(tags) for tags in modules.values())
+        logger.info(
+            "Inventory %s has %s installed modules." % (cli.inventory.path, count)
+        )
+        return
+
+    records = [
+        record for tags in cli.inventory.load().values() for record in tags.values()
+    ]
+    print(shpc.utils.print_json(sorted(records, key=lambda x: (x["name"], x["tag"]))))
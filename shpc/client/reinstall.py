@@ -42,9 +42,12 @@ def main(args, parser, extra, subparser):
 
         # Reinstall all installed software
         print("Reinstalling all installed software...")
+        touched = 0
         for software in installed_software.keys():
-            reinstall(software, cli, args, update_containers=args.update_containers)
-        logger.info("All software reinstalled.")
+            touched += reinstall(
+                software, cli, args, update_containers=args.update_containers
+            )
+        logger.info(f"All software reinstalled, {touched} files written.")
 
     # Reinstall a specific software
     else:
@@ -58,6 +61,8 @@ def main(args, parser, extra, subparser):
 def reinstall(name, cli, args, update_containers=False):
     """
     Reinstall a specific version or all versions of a software.
+
+    Returns the number of files written.
     """
     # Check if the provided recipe is known in any registry
     try:
@@ -85,20 +90,35 @@ def reinstall(name, cli, args, update_containers=False):
     # Handle reinstallation logic
     if specific_version:
         print(f"Reinstalling {name}...")
-        reinstall_version(name, cli, args, update_containers)
-        logger.info(f"Successfully reinstalled {name}.")
+        touched = reinstall_version(name, cli, args, update_containers)
+        logger.info(f"Successfully reinstalled {name}, {touched} files written.")
     else:
         print(f"Reinstalling all versions of {name}...")
+        touched = 0
         for version in installed_versions:
             version_name = f"{name}:{version}"
-            reinstall_version(version_name, cli, args, update_containers)
-        logger.info(f"Successfully reinstalled all versions of {name}.")
+            touched += reinstall_version(version_name, cli, args, update_containers)
+        logger.info(
+            f"Successfully reinstalled all versions of {name}, {touched} files written."
+        )
+    return touched
 
 
 def reinstall_version(name, cli, args, update_containers):
     """
-    Sub-function to handle the actual reinstallation
+    Sub-function to handle the actual reinstallation, returning files written
     """
+    # Keeping the container, the install replaces module files and wrapper
+    # scripts in one step, so the module is never missing and views are kept.
+    # Files generated from the same inputs (or with the same content) are kept.
+    if not update_containers:
+        print(
+            "Container was successfully preserved, module files and wrapper scripts that changed will be overwritten..."
+        )
+        module = cli.get_module(name)
+        cli.install(name, module=module)
+        return module.touched
+
     # Get the list of views the software was in
     views_with_module = set()
     views_dir = cli.new_module(name).module_dir
@@ -106,19 +126,13 @@ def reinstall_version(name, cli, args, update_containers):
         if entry.exists(views_dir):
             views_with_module.add(view_name)
 
-    # Uninstallation process. By default, uninstall without prompting the user and keep the container except the user wants a complete reinstall
-    cli.uninstall(name, force=True, keep_container=not update_containers)
-
-    # Display a helpful message to the user about the state of the container during reinstall process
-    if not update_containers:
-        print(
-            "Container was successfully preserved, module files and wrapper scripts will be overwritten..."
-        )
-    else:
-        print("No container was preserved, all files will be overwritten...")
+    # Uninstall without prompting the user, and the container is pulled again
+    cli.uninstall(name, force=True)
+    print("No container was preserved, all files will be overwritten...")
 
     # Installation process
-    cli.install(name)
+    module = cli.get_module(name)
+    cli.install(name, module=module)
 
     # Restore the software to the captured views
     print(
@@ -127,3 +141,4 @@ def reinstall_version(name, cli, args, update_containers):
     for view_name in views_with_module:
         cli.view_install(view_name, name)
         logger.info(f"Restored {name} to view: {view_name}")
+    return module.touched
@@ -0,0 +1,19 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import shpc.utils
+
+
+def main(args, parser, extra, subparser):
+    from shpc.main import get_client
+
+    shpc.utils.ensure_no_extra(extra)
+
+    cli = get_client(quiet=args.quiet, settings_file=args.settings_file)
+
+    # One off custom registry, reload
+    if args.registry:
+        cli.settings.registry = [args.registry]
+        cli.reload_registry()
+    cli.search(" ".join(args.query), limit=args.limit)
@@ -24,4 +24,5 @@ def main(args, parser, extra, subparser):
         names_only=not args.versions,
         filter_string=args.filter_string,
         limit=args.limit,
+        json_lines=args.json_lines,
     )
@@ -29,4 +29,5 @@ def sync_registry(args, parser, extra, subparser):
         config_file=args.config_file,
         upgrade_all=args.upgrade_all,
         add_new=not args.existing_only,
+        jobs=args.jobs,
     )
@@ -2,6 +2,10 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
 import shpc.utils as utils
 from shpc.logger import logger
 
@@ -22,6 +26,10 @@ def main(args, parser, extra, subparser):
             "Incomplete command. The following arguments are required: upgrade_recipe, --all, or -h for more details"
         )
 
+    # The json output is only the plan, so nothing is upgraded with it
+    if args.json and not (args.upgrade_all and args.dryrun):
+        logger.exit("--json can only be used with --all --dry-run.")
+
     # Get the list of installed software
     installed_software = cli.list(return_modules=True)
 
@@ -77,44 +85,128 @@ def main(args, parser, extra, subparser):
 
     # Upgrade all installed software
     elif args.upgrade_all:
-        # Store the number of all outdated software
-        num_outdated = 0
+        # Plan first: outdated software and the views it is in, without pulling
+        plan = plan_upgrades(cli, list(installed_software), jobs=args.jobs)
+        outdated = [entry for entry in plan if entry["outdated"]]
 
         # Does the user just want a dry-run of all software?
         if args.dryrun:
-            print("Performing a dry-run on all your software...")
-            for software in installed_software.keys():
-                version_info = upgrade(software, cli, args, dryrun=True)
-                if version_info:
+            if args.json:
+                print(json.dumps(plan, indent=4))
+            else:
+                print_plan(plan)
+                if not outdated:
+                    logger.info("All your software are currently up to date.")
+                else:
                     logger.info(
-                        f"{software} is outdated. Latest version available is {version_info}"
+                        f"You have a total of {len(outdated)} outdated software."
                     )
-                    num_outdated += 1
-                else:
-                    logger.info(f"{software} is up to date.")
-            # Provide a report on the dry-run
-            if num_outdated == 0:
-                logger.info("All your software are currently up to date.")
-            else:
-                logger.info(f"You have a total of {num_outdated} outdated software.")
 
         # Upgrade all software
         else:
-            print("Checking your list to upgrade outdated software...")
-            for software in installed_software.keys():
-                # Attempt upgrade on each software
-                upgrade_info = upgrade(
-                    software, cli, args, dryrun=False, force=args.force
-                )
-                # Count actual upgrades
-                if upgrade_info:
-                    num_outdated += 1
-            if num_outdated == 0:
+            if not outdated:
                 logger.info("No upgrade needed. All your software are up to date.")
-            else:
-                logger.info(
-                    f"Updated {num_outdated} outdated software from your list\nAll your software are now up to date."
-                )
+                return
+            print_plan(outdated)
+            results = upgrade_all(cli, outdated, jobs=args.jobs, force=args.force)
+            upgraded = [
+                name for name, result in results.items() if result == "installed"
+            ]
+            logger.info(
+                f"Updated {len(upgraded)} of {len(outdated)} outdated software from your list."
+            )
+            if len(upgraded) != len(outdated):
+                sys.exit(1)
+
+
+def plan_upgrades(cli, names, jobs=1):
+    """
+    Plan upgrades, returning the latest version of each software and its views.
+
+    Installed versions and views come from the inventory, and recipes are
+    loaded up to jobs at once. Nothing is pulled.
+    """
+    installed = cli.list(return_modules=True)
+    inventory = cli.inventory.load()
+
+    def plan(name):
+        views = set()
+        for record in inventory.get(name, {}).values():
+            views.update(record.get("views") or [])
+        entry = {
+            "name": name,
+            "installed": sorted(installed.get(name, [])),
+            "latest": None,
+            "outdated": False,
+            "views": sorted(views),
+        }
+        try:
+            config = cli._load_container(cli.add_namespace(name))
+            entry["latest"] = get_latest_version(name, config)
+        except SystemExit:
+            entry["error"] = "cannot find the latest version in any registry"
+            return entry
+        entry["outdated"] = entry["latest"] not in entry["installed"]
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        return list(executor.map(plan, names))
+
+
+def print_plan(plan):
+    """
+    Print an upgrade plan as a table.
+    """
+    rows = [["software", "installed", "latest", "views"]]
+    for entry in plan:
+        latest = entry["latest"] or entry.get("error", "")
+        if entry["latest"] and not entry["outdated"]:
+            latest += " (installed)"
+        rows.append(
+            [
+                entry["name"],
+                ", ".join(entry["installed"]),
+                latest,
+                ", ".join(entry["views"]) or "-",
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print(
+            "  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip()
+        )
+
+
+def upgrade_all(cli, outdated, jobs=1, force=False):
+    """
+    Install the latest version of outdated software, pulling up to jobs at once.
+
+    As each is installed, it is added to the views of the old versions, and
+    then the old versions are uninstalled (if the user agrees).
+    """
+    uninstall_old = utils.confirm_action(
+        "Do you wish to uninstall the old versions of software that is upgraded?",
+        force=force,
+    )
+    update_views = any(entry["views"] for entry in outdated) and utils.confirm_action(
+        "Do you also want to install the latest versions to the view(s) of the previous version(s)?",
+        force=force,
+    )
+    entries = {"%s:%s" % (entry["name"], entry["latest"]): entry for entry in outdated}
+
+    def upgraded(name, module):
+        entry = entries[name]
+        if update_views:
+            for view_name in entry["views"]:
+                cli.view_install(view_name, name, force=True)
+                logger.info(f"Installed {name} to view: {view_name}")
+        if uninstall_old:
+            for tag in entry["installed"]:
+                cli.uninstall("%s:%s" % (entry["name"], tag), force=True)
+        else:
+            logger.info("Old versions of " + entry["name"] + " were preserved")
+
+    return cli.install_many(list(entries), jobs=jobs, callback=upgraded)
 
 
 def upgrade(name, cli, args, dryrun=False, force=False):
@@ -17,6 +17,9 @@ user_settings_file = os.path.join(
     os.path.expanduser("~/.singularity-hpc"), "settings.yml"
 )
 
+# The default location for shpc caches (e.g., the registry index)
+cache_base = os.path.join(os.path.expanduser("~/.singularity-hpc"), "cache")
+
 # variables in settings that allow environment variable expansion
 allowed_envars = [
     "container_base",
@@ -24,6 +27,8 @@ allowed_envars = [
     "views_base",
     "wrapper_base",
     "registry",
+    "cache_base",
+    "shared_container_caches",
 ]
 
 # The default GitHub registry with recipes (for docgen)
@@ -3,8 +3,11 @@ __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
 
+import itertools
+import json
 import os
 import shutil
+import sys
 
 import shpc.main.container as container
 import shpc.main.registry as registry
@@ -114,6 +117,32 @@ class Client:
             name = "%s/%s" % (self.settings.namespace.strip("/"), name)
         return name
 
+    def resolve_name(self, name):
+        """
+        Resolve a short name (e.g., samtools) to a unique full recipe name.
+
+        This is only done without a namespace, and for a name that is not
+        already a recipe. A tag (name:tag) is kept.
+        """
+        if self.settings.namespace or "/" in name:
+            return name
+        short, tag = name, None
+        if ":" in name:
+            short, tag = name.split(":", 1)
+        if self.registry.find(short):
+            return name
+
+        matches = self.registry.resolve(short)
+        if len(matches) > 1:
+            logger.exit(
+                "%s matches more than one recipe, please choose one:\n%s"
+                % (short, "\n".join(matches))
+            )
+        if not matches:
+            return name
+        logger.info("%s resolved to %s" % (short, matches[0]))
+        return matches[0] if tag is None else "%s:%s" % (matches[0], tag)
+
     def load_registry_config(self, name):
         """
         Given an identifier, find the first match in a registry provider.
@@ -137,9 +166,11 @@ class Client:
         config.set_tag(tag)
         return config
 
-    def update(self, name=None, dryrun=False, filters=None):
+    def update(self, name=None, dryrun=False, filters=None, jobs=8):
         """
         Given a module name (or None for all modules) upgrade the registry.
+
+        Digests for the tags of each are looked up up to jobs at a time.
         """
         # No name provided == "update all"
         if name:
@@ -149,7 +180,7 @@ class Client:
 
         for module_name in modules:
             config = self._load_container(module_name)
-            config.update(dryrun=dryrun, filters=filters)
+            config.update(dryrun=dryrun, filters=filters, jobs=jobs)
 
     def test(
         self,
@@ -247,36 +278,100 @@ class Client:
         """
         raise NotImplementedError
 
-    def show(self, name, names_only=False, out=None, filter_string=None, limit=None):
+    def search(self, query, limit=None):
+        """
+        Search the registries, showing the best matches first.
+        """
+        results = self.registry.search(query, limit=limit)
+        if not results:
+            logger.info("There were no matches for %s." % query)
+        for module, _ in results:
+            print(module)
+        return [module for module, _ in results]
+
+    def validate(self, jobs=1, force=False, out=None, as_json=False):
+        """
+        Validate registry container.yaml files, and show or save a report.
+        """
+        report = self.registry.validate(jobs=jobs, force=force)
+        if out is not None:
+            utils.write_json(report, out)
+        if as_json:
+            print(utils.print_json(report))
+        else:
+            for result in report["results"]:
+                for error in result["errors"]:
+                    logger.error("%s: %s" % (result["path"], error))
+            logger.info(
+                "%s container.yaml files: %s passed, %s failed, %s skipped (unchanged)."
+                % (
+                    report["total"],
+                    report["passed"],
+                    report["failed"],
+                    report["skipped"],
+                )
+            )
+        return report
+
+    def show(
+        self,
+        name,
+        names_only=False,
+        out=None,
+        filter_string=None,
+        limit=None,
+        json_lines=False,
+    ):
         """
         Show available packages
+
+        Entries are streamed to the terminal (or out) as they are found, and
+        a config is only loaded if we need more than the name.
         """
         if name:
             name = self.add_namespace(name)
             config = self._load_container(name)
             config.dump(out)
-        else:
-            # Assemble the list of contents to write
-            modules = []
-            for i, entry in enumerate(
-                self.registry.iter_registry(filter_string=filter_string)
-            ):
-                # Break after the limit
-                if limit and i > limit:
-                    break
-
-                config = container.ContainerConfig(entry)
-                if names_only:
-                    if out is None:
-                        print(config.name)
-                    modules.append(config.name)
-                else:
-                    for version in config.tags.keys():
-                        module = "%s:%s" % (config.name, version)
-                        if out is None:
-                            print(module)
-                        modules.append(module)
-
-            # Write output to file or print to terminal
+            return
+
+        entries = self.registry.iter_registry(filter_string=filter_string)
+        if limit:
+            entries = itertools.islice(entries, limit)
+
+        fd = open(out, "w") if out is not None else sys.stdout
+        try:
+            for entry in entries:
+                for line in self._show_lines(entry, names_only, json_lines):
+                    fd.write(line + "\n")
+        finally:
             if out is not None:
-                utils.write_file(out, "\n".join(modules))
+                fd.close()
+
+    def _show_lines(self, entry, names_only=False, json_lines=False):
+        """
+        Yield the lines to show for one registry entry.
+
+        The container name is shown in every mode. Without versions we only
+        need the name, so the entry is not validated.
+        """
+        if names_only:
+            name = str(container.ContainerConfig(entry, validate=False).name)
+            if json_lines:
+                yield json.dumps({"name": name, "path": entry.package_file})
+            else:
+                yield name
+            return
+
+        config = container.ContainerConfig(entry)
+        versions = list(config.tags.keys())
+        if json_lines:
+            yield json.dumps(
+                {
+                    "name": str(config.name),
+                    "path": entry.package_file,
+                    "versions": versions,
+                }
+            )
+            return
+        for version in versions:
+            yield "%s:%s" % (config.name, version)
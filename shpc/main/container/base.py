@@ -11,6 +11,7 @@ from jinja2 import Template
 import shpc.main.templates
 import shpc.utils
 from shpc.logger import logger
+from shpc.main.modules.inventory import Inventory
 
 
 class ContainerName:
@@ -84,6 +85,12 @@ class ContainerTechnology:
         """
         pass
 
+    def gc(self):
+        """
+        If a container technology shares storage between modules, clean it up
+        """
+        pass
+
     def module_dir(self, name):
         """
         Get the module directory the container references
@@ -135,6 +142,11 @@ class ContainerTechnology:
         """
         Get a list of installed tags.
         """
+        inventory = Inventory(self.settings)
+        if inventory.exists():
+            tags = inventory.tags(module_name)
+            if tags:
+                return tags
         module_dir = os.path.join(self.settings.module_base, module_name)
         if not os.path.exists(module_dir):
             logger.exit("%s does not exist." % module_dir)
@@ -14,6 +14,7 @@ try:
 except ImportError:
     from ruamel.yaml import YAML
 
+import functools
 import os
 import sys
 
@@ -22,6 +23,23 @@ import jsonschema
 here = os.path.abspath(os.path.dirname(__file__))
 
 
+@functools.lru_cache(maxsize=None)
+def get_validator():
+    """
+    Get the (compiled) validator for a container config, once per process.
+    """
+    return jsonschema.Draft7Validator(schemas.containerConfig)
+
+
+def validate_config(config):
+    """
+    Validate a container config, raising the best matching error (if any).
+    """
+    error = jsonschema.exceptions.best_match(get_validator().iter_errors(config))
+    if error is not None:
+        raise error
+
+
 class Tags:
     """
     Make it easy to interact with tags (name and version)
@@ -176,15 +194,17 @@ class ContainerConfig:
                 return False
         return True
 
-    def update(self, dryrun=False, filters=None):
+    def update(self, dryrun=False, filters=None, jobs=8):
         """
         Update a container.yaml, meaning the tags and latest.
+
+        Digests for the tags are looked up up to jobs at a time.
         """
         updated = None
         if self.docker or self.oras:
             previous_tags = self.get("tags", {})
             previous_latest = self.get("latest", {})
-            updated = update.update_config_tags(self, filters=filters)
+            updated = update.update_config_tags(self, filters=filters, jobs=jobs)
 
             # print the container name and latest tag:
             print(add_prefix(underline(self.docker or self.oras)))
@@ -293,7 +313,7 @@ class ContainerConfig:
         """
         Validate a loaded config with jsonschema
         """
-        jsonschema.validate(instance=self.entry._config, schema=schemas.containerConfig)
+        validate_config(self.entry._config)
 
     def get_envars(self):
         """
@@ -61,7 +61,7 @@ class DockerContainer(ContainerTechnology):
             uri = "docker.io/%s" % uri
         return uri
 
-    def registry_pull(self, module_dir, container_dir, config, tag):
+    def registry_pull(self, module_dir, container_dir, config, tag, prefix=None):
         """
         Pull a container to the library.
         """
@@ -71,15 +71,17 @@ class DockerContainer(ContainerTechnology):
 
         tag_uri = "%s:%s" % (self.add_registry(config.docker), tag.name)
         tag_digest = "%s@%s" % (self.add_registry(config.docker), tag.digest)
-        self.pull(tag_digest)
+        self.pull(tag_digest, prefix=prefix)
         # Podman doesn't keep a record of digest->tag, so we tag after
         return self.tag(tag_digest, tag_uri)
 
-    def pull(self, uri):
+    def pull(self, uri, prefix=None):
         """
         Pull a unique resource identifier.
         """
-        res = shpc.utils.run_command([self.command, "pull", uri], stream=True)
+        res = shpc.utils.run_command(
+            [self.command, "pull", uri], stream=True, prefix=prefix
+        )
         if res["return_code"] != 0:
             logger.exit("There was an issue pulling %s" % uri)
         return uri
@@ -218,7 +220,7 @@ class DockerContainer(ContainerTechnology):
         if self.settings.wrapper_scripts["enabled"] is True:
             wrapper_scripts = shpc.main.wrappers.generate(
                 aliases=aliases,
-                wrapper_dir=module.wrapper_dir,
+                wrapper_dir=module.staged(module.wrapper_dir),
                 features=features,
                 container=self,
                 image=module.container_path,
@@ -232,7 +234,7 @@ class DockerContainer(ContainerTechnology):
             aliases=aliases,
             features=features,
             labels=labels,
-            creation_date=datetime.now(),
+            creation_date=module.creation_date or datetime.now(),
             command=self.command,
             module=module,
             parsed_name=module.config.name,
@@ -0,0 +1,134 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import json
+import mmap
+import struct
+
+# The global header: launch script, magic, version, arch, uuid, and then
+# created, modified, descriptors free, total, offset and size, data offset and size
+header_format = "<32s10s3s3s16s8q"
+
+# A descriptor: data type, used, id, group id, linked id, and then
+# offset, size, size with padding, created, modified, uid, gid, name and extra
+descriptor_format = "<i?3I7q128s384s"
+
+header_size = struct.calcsize(header_format)
+descriptor_size = struct.calcsize(descriptor_format)
+
+# Data object types we read metadata from
+data_deffile = 0x4001
+data_labels = 0x4003
+data_generic_json = 0x4006
+
+
+class SIFImage:
+    """
+    Read the header and data objects of a Singularity Image Format file.
+
+    The file is memory mapped, so only the header, descriptors and the
+    (small) metadata objects are read, and never the filesystem partition.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._fd = open(self.path, "rb")
+        try:
+            self._mm = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._fd.close()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        self._mm.close()
+        self._fd.close()
+
+    @property
+    def header(self):
+        if len(self._mm) < header_size:
+            raise ValueError("%s is too small to be a SIF image" % self.path)
+        values = struct.unpack_from(header_format, self._mm, 0)
+        if values[1].rstrip(b"\0") != b"SIF_MAGIC":
+            raise ValueError("%s is not a SIF image" % self.path)
+        return {
+            "version": values[2].rstrip(b"\0").decode(),
+            "arch": values[3].rstrip(b"\0").decode(),
+            "descriptors_total": values[8],
+            "descriptors_offset": values[9],
+        }
+
+    def descriptors(self):
+        """
+        Yield the used descriptors, as (data type, name, offset, size)
+        """
+        header = self.header
+        for i in range(header["descriptors_total"]):
+            start = header["descriptors_offset"] + i * descriptor_size
+            if start + descriptor_size > len(self._mm):
+                raise ValueError("%s has a truncated descriptor table" % self.path)
+            values = struct.unpack_from(descriptor_format, self._mm, start)
+            if not values[1]:
+                continue
+            offset, size = values[5], values[6]
+            if offset < 0 or size < 0 or offset + size > len(self._mm):
+                raise ValueError("%s has a descriptor out of bounds" % self.path)
+            name = values[12].rstrip(b"\0").decode(errors="replace")
+            yield values[0], name, offset, size
+
+    def read(self, offset, size):
+        return self._mm[offset : offset + size].decode(errors="replace")
+
+    def inspect(self):
+        """
+        Get inspect metadata (labels, deffile, runscript, etc.) like singularity.
+
+        Returns None if the image does not have any metadata objects.
+        """
+        attributes = {}
+        deffile = None
+        labels = None
+        for data_type, name, offset, size in self.descriptors():
+            if data_type == data_generic_json:
+                try:
+                    metadata = json.loads(self.read(offset, size))
+                except ValueError:
+                    continue
+                if not isinstance(metadata, dict):
+                    continue
+                metadata = metadata.get("data", metadata)
+                if isinstance(metadata.get("attributes"), dict):
+                    attributes.update(metadata["attributes"])
+            elif data_type == data_deffile:
+                deffile = self.read(offset, size).rstrip("\n")
+            elif data_type == data_labels:
+                labels = self.read(offset, size)
+
+        # Older images only have the deffile and labels objects
+        if deffile is not None:
+            attributes.setdefault("deffile", deffile)
+        if labels is not None and not attributes.get("labels"):
+            attributes["labels"] = labels
+        if not attributes:
+            return
+
+        if isinstance(attributes.get("labels"), str):
+            try:
+                attributes["labels"] = json.loads(attributes["labels"])
+            except ValueError:
+                pass
+        return {"attributes": attributes, "type": "container"}
+
+
+def inspect(path):
+    """
+    Get inspect metadata from a SIF image, or None if it cannot be read.
+    """
+    try:
+        with SIFImage(path) as sif:
+            return sif.inspect()
+    except (OSError, ValueError, struct.error):
+        return
@@ -3,9 +3,12 @@ __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
 
+import hashlib
+import json
 import os
 import re
 import shutil
+import time
 from datetime import datetime
 from glob import glob
 
@@ -13,8 +16,11 @@ import shpc.main.container.update as update
 import shpc.main.wrappers
 import shpc.utils as utils
 from shpc.logger import logger
+from shpc.main.modules.inventory import Inventory, container_digest
 
+from . import sif
 from .base import ContainerTechnology
+from .store import ContainerStore
 
 
 class SingularityContainer(ContainerTechnology):
@@ -186,7 +192,7 @@ class SingularityContainer(ContainerTechnology):
                 continue
             os.remove(older)
 
-        # Get inspect metadata from the container (only if singularity installed
+        # Get inspect metadata from the container
         try:
             metadata = self.inspect(module.container_path)
 
@@ -195,7 +201,11 @@ class SingularityContainer(ContainerTechnology):
             deffile = (
                 metadata.get("attributes", {}).get("deffile", "").replace("\n", "\\n")
             )
-        except Exception:
+        except Exception as e:
+            logger.warning(
+                "Cannot inspect %s, labels and deffile are not added: %s"
+                % (module.container_path, e)
+            )
             metadata = None
             deffile = None
             labels = {}
@@ -213,7 +223,7 @@ class SingularityContainer(ContainerTechnology):
                 aliases=aliases,
                 features=features,
                 container=self,
-                wrapper_dir=module.wrapper_dir,
+                wrapper_dir=module.staged(module.wrapper_dir),
                 image=module.container_path,
                 config=module.config,
             )
@@ -225,14 +235,14 @@ class SingularityContainer(ContainerTechnology):
             features=features,
             labels=labels,
             deffile=deffile,
-            creation_date=datetime.now(),
+            creation_date=module.creation_date or datetime.now(),
             module=module,
             parsed_name=module.config.name,
             wrapper_scripts=wrapper_scripts,
         )
         utils.write_file(module_path, out)
 
-    def registry_pull(self, module_dir, container_dir, config, tag):
+    def registry_pull(self, module_dir, container_dir, config, tag, prefix=None):
         """
         Given a module directory, container config, and tag, pull the container
         """
@@ -253,15 +263,105 @@ class SingularityContainer(ContainerTechnology):
         elif pull_type == "gh":
             container_uri = "gh://%s/%s:%s" % (config.gh, tag.digest, tag.name)
 
-        # Pull new containers
+        # Reference a container from a shared cache, or pull into the store
         if not os.path.exists(container_path):
-            self.pull(container_uri, container_path)
+            shared = self._shared_container(container_path, container_uri, tag.digest)
+            if shared:
+                utils.mkdir_p(container_dir)
+                os.symlink(shared, container_path)
+            else:
+                self._store_pull(
+                    container_uri, tag.digest, container_path, prefix=prefix
+                )
+                if self.settings.shared_container_caches:
+                    self._record_shared(container_uri, "miss", container_path)
 
         # Exit early if there is an issue
         if not os.path.exists(container_path):
             container_path = None
         return container_path
 
+    @property
+    def store(self):
+        """
+        The content addressed store, shared by modules under the container base.
+        """
+        return ContainerStore(self.settings.container_base or self.settings.module_base)
+
+    def _shared_container(self, container_path, container_uri, digest):
+        """
+        Look for a container in the shared (read only) container caches.
+
+        A cache can be another container base, and we look in its store and
+        at the same path relative to the container base as the module.
+        """
+        base = self.settings.container_base or self.settings.module_base
+        relpath = os.path.relpath(container_path, base)
+        key = ContainerStore.key(digest, container_uri)
+        for cache in self.settings.shared_container_caches or []:
+            cache = os.path.abspath(cache)
+            for path in [ContainerStore(cache).path(key), os.path.join(cache, relpath)]:
+                if os.path.isfile(path):
+                    logger.info(
+                        "Using %s from shared cache %s" % (container_uri, cache)
+                    )
+                    self._record_shared(container_uri, "hit", path, cache)
+                    return path
+
+    def _record_shared(self, container_uri, result, path=None, cache=None):
+        """
+        Record a shared cache hit or miss (with the image size) to size the cache.
+        """
+        record = {
+            "time": time.time(),
+            "uri": container_uri,
+            "result": result,
+            "cache": cache,
+            "size": os.path.getsize(path) if path and os.path.exists(path) else None,
+        }
+        filename = os.path.join(self.settings.cache_dir, "shared-containers.jsonl")
+        try:
+            utils.mkdir_p(os.path.dirname(filename))
+            utils.write_file(filename, json.dumps(record) + "\n", mode="a")
+        except OSError as e:
+            logger.warning("Cannot record shared cache %s: %s" % (result, e))
+
+    def _store_pull(self, container_uri, digest, container_path, prefix=None):
+        """
+        Pull a container to the store if we don't have it, and link it to the
+        container path. The store is locked (but not during the pull) so a
+        stored file is not removed by another process before it is linked.
+
+        Only one process (or thread) pulls a digest at once, and others
+        waiting for it use the stored file when the pull is done.
+        """
+        store = self.store
+        key = store.key(digest, container_uri)
+        blob = store.path(key)
+        with store.pulling(key):
+            with store.locked():
+                if os.path.exists(blob):
+                    logger.info("Using %s from the container store" % container_uri)
+                    return store.link(blob, container_path)
+
+            # Pull to a temporary name so a failed pull is never in the store
+            tmp = store.tmp_path(key)
+            utils.mkdir_p(os.path.dirname(tmp))
+            try:
+                self.pull(container_uri, tmp, prefix=prefix)
+                if os.path.exists(tmp):
+                    with store.locked():
+                        return store.link(store.add(key, tmp), container_path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+    def gc(self):
+        """
+        Remove containers in the store no longer used by a module.
+        """
+        return self.store.gc()
+
     def check(self, module_name, config):
         """
         Given a module name, check if it's the latest version
@@ -276,15 +376,12 @@ class SingularityContainer(ContainerTechnology):
         """
         Check if the installed tag is the latest.
         """
-        # Derive the registry entry from the module_name
-        dirname = os.path.join(self.settings.module_base, module_name)
-
         # Does the user have the modules installed?
-        if not os.path.exists(dirname):
+        versions = self.installed_tags(module_name)
+        if not versions:
             logger.exit("%s is not installed." % module_name)
 
-        # Compare the latest name to the version folders
-        versions = os.listdir(dirname)
+        # Compare the latest name to the installed versions
         if config.latest.name not in versions:
             logger.exit(
                 "The latest tag is %s, but you have: %s."
@@ -297,15 +394,13 @@ class SingularityContainer(ContainerTechnology):
         """
         Check if there is an updated digest for a tag.
 
-        At this point we assume only one container per install, as older containers
-        are cleaned up to save filesystem space. If this is changed, we would
-        need another way to deduce what version of the container is installed.
+        The installed digest is recorded in the inventory. For a module
+        installed before that, we assume only one container per install, and
+        derive the digest from the container name.
         """
-        sif = os.path.basename(image)
-
-        # The prefix of the image is the module_name (which includes version here)
-        prefix = re.sub("(:|[/])", "-", module_name) + "-"
-        digest = sif.replace(prefix, "").replace(".sif", "")
+        name, tag = module_name.split(":", 1)
+        record = Inventory(self.settings).get(name, tag) or {}
+        digest = record.get("digest") or container_digest(name, tag, image)
 
         # Get the latest version digest, remove the tag first
         tag = module_name.split(":")[-1]
@@ -326,16 +421,16 @@ class SingularityContainer(ContainerTechnology):
         """
         self.client.shell(image)
 
-    def pull(self, uri, dest):
+    def pull(self, uri, dest, prefix=None):
         """
         Pull a container to a destination
         """
         if re.search("^(docker|shub|https|oras)", uri):
-            return self._pull_regular(uri, dest)
+            return self._pull_regular(uri, dest, prefix=prefix)
         elif uri.startswith("gh://"):
             return self._pull_github(uri, dest)
 
-    def _pull_regular(self, uri, dest):
+    def _pull_regular(self, uri, dest, prefix=None):
         """
         Pull a URI that Singularity recognizes
         """
@@ -345,14 +440,50 @@ class SingularityContainer(ContainerTechnology):
             uri, name=name, pull_folder=pull_folder, stream=True
         )
         for line in lines:
+            if prefix:
+                line = prefix + line
             print(line, end="")
         return image
 
     def inspect(self, image):
         """
         Inspect an image and return metadata.
+
+        The metadata is read from the SIF file itself when we can, so we
+        don't need a subprocess (or singularity installed).
+
+        Metadata is cached by the image file (device, inode, modified time
+        and size), so an unchanged image, or a container shared from the
+        store, is only inspected once.
         """
-        return self.client.inspect(image)
+        cache_file = self._inspect_cache_file(image)
+        if cache_file and os.path.exists(cache_file):
+            try:
+                return utils.read_json(cache_file)
+            except (OSError, ValueError):
+                pass
+
+        # Read the image metadata directly, and only ask singularity if we can't
+        metadata = sif.inspect(image) or self.client.inspect(image)
+        if cache_file and isinstance(metadata, dict) and "attributes" in metadata:
+            try:
+                utils.mkdir_p(os.path.dirname(cache_file))
+                utils.write_file(cache_file, json.dumps(metadata), atomic=True)
+            except OSError as e:
+                logger.warning("Cannot cache inspect metadata for %s: %s" % (image, e))
+        return metadata
+
+    def _inspect_cache_file(self, image):
+        """
+        Get the inspect cache file for an image, or None if it does not exist.
+        """
+        try:
+            st = os.stat(image)
+        except (OSError, TypeError):
+            return
+        key = json.dumps([st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.settings.cache_dir, "inspect", "%s.json" % digest)
 
     def _pull_github(self, uri, dest=None):
         """
@@ -0,0 +1,143 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+
+import hashlib
+import json
+import os
+import uuid
+
+import shpc.utils as utils
+from shpc.logger import logger
+
+
+class ContainerStore:
+    """
+    A content addressed store of container files, shared by modules.
+
+    Containers are stored once under <base>/.store/sha256/<xx>/<digest>.sif,
+    and each module container directory gets a hard link to the stored file
+    (or a symbolic link if a hard link is not possible, e.g., across
+    filesystems). A stored file without links is removed by gc.
+    """
+
+    def __init__(self, base):
+        self.root = os.path.join(base, ".store", "sha256")
+
+    def locked(self):
+        """
+        Lock the store, to link to or remove stored files.
+        """
+        return utils.locked(self.root, os.path.dirname(self.root))
+
+    def pulling(self, key):
+        """
+        Lock a digest while it is pulled, so it is only pulled once.
+        """
+        return utils.locked(self.path(key), os.path.dirname(self.root))
+
+    @staticmethod
+    def key(digest, uri=None):
+        """
+        Get the store key for a container digest (or a uri if not a sha256)
+        """
+        if digest and str(digest).startswith("sha256:"):
+            return digest.split(":", 1)[1]
+        return hashlib.sha256(str(uri or digest).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], "%s.sif" % key)
+
+    def tmp_path(self, key):
+        """
+        A unique temporary path to pull to, moved into place when complete.
+        """
+        return os.path.join(self.root, key[:2], ".%s.%s.sif" % (key, uuid.uuid4().hex))
+
+    def _links_file(self, blob):
+        return blob[: -len(".sif")] + ".links"
+
+    def _read_links(self, blob):
+        links_file = self._links_file(blob)
+        if not os.path.exists(links_file):
+            return []
+        try:
+            return utils.read_json(links_file)
+        except (OSError, ValueError):
+            return []
+
+    def add(self, key, pulled):
+        """
+        Move a pulled file into the store, and return the stored path.
+        """
+        blob = self.path(key)
+        os.replace(pulled, blob)
+        return blob
+
+    def link(self, blob, dest):
+        """
+        Link a stored file into a module container directory.
+
+        Two names can share a container path (e.g., salad and salad:latest),
+        so an existing link to the blob is kept, and anything else at dest is
+        replaced by linking to a temporary name first.
+        """
+        utils.mkdir_p(os.path.dirname(dest))
+        if os.path.exists(dest) and os.path.samefile(blob, dest):
+            return dest
+
+        tmp = os.path.join(
+            os.path.dirname(dest),
+            ".%s.%s" % (os.path.basename(dest), uuid.uuid4().hex),
+        )
+        try:
+            os.link(blob, tmp)
+            os.replace(tmp, dest)
+            return dest
+        except OSError as e:
+            logger.debug("Cannot hard link %s, using a symlink: %s" % (blob, e))
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+
+        # Symbolic links are not counted by the filesystem, so we record them
+        os.symlink(blob, tmp)
+        os.replace(tmp, dest)
+        links = self._read_links(blob)
+        if dest not in links:
+            links.append(dest)
+        utils.write_file(self._links_file(blob), json.dumps(links), atomic=True)
+        return dest
+
+    def refcount(self, blob):
+        """
+        Count module links to a stored file (hard links and symbolic links)
+        """
+        count = os.stat(blob).st_nlink - 1
+        for link in self._read_links(blob):
+            if os.path.islink(link) and os.path.realpath(link) == os.path.realpath(
+                blob
+            ):
+                count += 1
+        return count
+
+    def gc(self):
+        """
+        Remove stored files that are no longer linked from any module.
+        """
+        removed = []
+        if not os.path.exists(self.root):
+            return removed
+        with self.locked():
+            for blob in utils.recursive_find(self.root, "[.]sif$"):
+                if os.path.basename(blob).startswith("."):
+                    continue
+                if self.refcount(blob) > 0:
+                    continue
+                os.remove(blob)
+                links_file = self._links_file(blob)
+                if os.path.exists(links_file):
+                    os.remove(links_file)
+                removed.append(blob)
+                logger.debug("Removed unused container %s" % blob)
+        return removed
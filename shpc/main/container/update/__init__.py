@@ -2,18 +2,22 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+from concurrent.futures import ThreadPoolExecutor
+
 from shpc.logger import logger
 
 from .diff import print_diff
-from .docker import DockerImage
+from .docker import DockerImage, get_session
 from .versions import filter_versions
 
 assert print_diff
 
 
-def update_config_tags(config, filters=None):
+def update_config_tags(config, filters=None, jobs=8):
     """
     Given a container config, update the latest tags
+
+    Digests for the tags are looked up up to jobs at a time.
     """
     # Both docker and oras are from OCI registries
     if config.docker or config.oras:
@@ -55,12 +59,11 @@ def update_config_tags(config, filters=None):
             }
         )
 
-        # Get updated hashes
+        # Get updated hashes, in the order of the tags
         tags = list(current_tags.keys())
-        for tag in tags:
-            try:
-                digest = get_container_tag(uri, tag)
-            except Exception:
+        digests = get_container_tags(uri, tags, jobs=jobs)
+        for tag, digest in zip(tags, digests):
+            if digest is None:
                 digest = {tag: current_tags[tag]}
 
             if not digest or digest[tag] == "unknown":
@@ -121,6 +124,25 @@ def get_container_tag(container_name, tag=None):
     return {tag: digest}
 
 
+def get_container_tags(container_name, tags, jobs=8):
+    """
+    Get the digests of several tags at once, in the same order as the tags.
+
+    A tag we cannot get a digest for is None.
+    """
+
+    def get_digest(tag):
+        try:
+            return get_container_tag(container_name, tag)
+        except Exception:
+            return
+
+    # The connection pool needs a connection for each job
+    get_session(jobs)
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        return list(executor.map(get_digest, tags))
+
+
 def get_latest_tags(container_name, tag=None):
     """
     Given a container name, get the latest tags.
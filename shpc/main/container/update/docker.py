@@ -3,11 +3,52 @@ __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
 import re
+import threading
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from shpc.logger import logger
 
+# One session (and connection pool) is shared by all requests in a process
+_session = None
+_session_lock = threading.Lock()
+
+# Connections kept open per host, or more if we make more requests at once
+pool_size = 16
+_session_pool_size = 0
+
+
+def get_session(jobs=None):
+    """
+    Get the shared session, which keeps connections alive between requests.
+
+    Requests that are rate limited (429) or fail on the server (5xx) are
+    retried with exponential backoff, honoring Retry-After. The connection
+    pool is made larger if more than pool_size jobs make requests at once.
+    """
+    global _session, _session_pool_size
+    size = max(pool_size, jobs or 0)
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if size > _session_pool_size:
+            retry = Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"],
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=size, pool_maxsize=size, max_retries=retry
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pool_size = size
+        return _session
+
 
 class DockerImage:
     """
@@ -24,7 +65,7 @@ class DockerImage:
         """
         Perform a get request, expecting status code 200.
         """
-        response = requests.get(url)
+        response = get_session().get(url, timeout=60)
         if response.status_code != 200:
             logger.exit("Issue with request %s" % url)
         return response
@@ -72,10 +113,10 @@ class DockerImage:
     def digest(self, tag):
         url = "%s/digest/%s:%s" % (self.apiroot, self.container_name, tag)
         response = self.get_request(url)
-        if "could not parse reference" in response:
-            logger.exit("Issue getting digest: %s" % response)
-        if "unsupported status" in response:
-            logger.exit("Issue getting digest: %s" % response)
+        if "could not parse reference" in response.text:
+            logger.exit("Issue getting digest: %s" % response.text)
+        if "unsupported status" in response.text:
+            logger.exit("Issue getting digest: %s" % response.text)
         if "MANIFEST_UNKNOWN" in response.text:
             logger.exit(
                 f"The tag {tag} you provided is not known. Check that it and the container both exist."
@@ -2,12 +2,14 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+import hashlib
 import inspect
 import json
 import os
 import subprocess
 import sys
 import urllib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
 import shpc.defaults as defaults
@@ -19,9 +21,35 @@ import shpc.main.registry as registry
 import shpc.utils as utils
 from shpc.logger import logger
 from shpc.main.client import Client as BaseClient
+from shpc.main.modules.inventory import Inventory, container_digest
+from shpc.main.wrappers.base import default_templates, get_templates_digest
+from shpc.version import __version__
 
 from .module import Module
 
+# Settings that module files and wrapper scripts are rendered from
+rendered_settings = [
+    "module_sys",
+    "container_tech",
+    "module_base",
+    "wrapper_base",
+    "container_base",
+    "module_name",
+    "default_version",
+    "label_separator",
+    "singularity_module",
+    "podman_module",
+    "bindpaths",
+    "enable_tty",
+    "singularity_shell",
+    "podman_shell",
+    "docker_shell",
+    "wrapper_shell",
+    "wrapper_scripts",
+    "environment_file",
+    "container_features",
+]
+
 
 class ModuleBase(BaseClient):
     def __init__(self, **kwargs):
@@ -30,6 +58,7 @@ class ModuleBase(BaseClient):
         self.here = os.path.dirname(inspect.getfile(self.__class__))
         self.template = templatectl.Template(self.settings)
         self.versionfile = versionfile.VersionFile(self.settings, self.module_extension)
+        self.inventory = Inventory(self.settings)
         self.detect_views()
 
     def detect_views(self):
@@ -51,6 +80,13 @@ class ModuleBase(BaseClient):
                 modulefile=self.modulefile,
             )
 
+    def locked(self, name):
+        """
+        Lock a module (all of its versions) against changes by other shpc processes.
+        """
+        module_dir = os.path.join(self.settings.module_base, name.split(":", 1)[0])
+        return utils.locked(module_dir, self.settings.lock_dir)
+
     @property
     def container_base(self):
         """
@@ -109,48 +145,56 @@ class ModuleBase(BaseClient):
             if not utils.confirm_action(msg, force):
                 return False  # If the user does not want to uninstall
 
-        # Podman needs image deletion
-        if not keep_container:  # For reinstall
-            self.container.delete(module.name)
+        with self.locked(module.name):
+            # Podman needs image deletion
+            if not keep_container:  # For reinstall
+                self.container.delete(module.name)
 
-        if module.container_dir != module.module_dir:
-            if not keep_container:
+            if module.container_dir != module.module_dir:
+                if not keep_container:
+                    self._uninstall(
+                        module.container_dir,
+                        self.container_base,
+                        "$container_base/%s" % module.name,
+                    )
+
+                self._uninstall(
+                    module.module_dir,
+                    self.settings.module_base,
+                    "$module_base/%s" % module.name,
+                )
+            else:
                 self._uninstall(
-                    module.container_dir,
-                    self.container_base,
-                    "$container_base/%s" % module.name,
+                    module.module_dir,
+                    self.settings.module_base,
+                    "$module_base/%s" % module.name,
                 )
 
-            self._uninstall(
-                module.module_dir,
-                self.settings.module_base,
-                "$module_base/%s" % module.name,
-            )
-        else:
-            self._uninstall(
-                module.module_dir,
-                self.settings.module_base,
-                "$module_base/%s" % module.name,
-            )
+            # Remove stored containers no other module links to
+            if not keep_container:
+                self.container.gc()
 
-        # If we have a wrapper
-        if module.wrapper_dir != module.module_dir:
-            self._uninstall(
-                module.wrapper_dir,
-                self.settings.wrapper_base,
-                "$wrapper_base/%s" % module.name,
-            )
+            # If we have a wrapper
+            if module.wrapper_dir != module.module_dir:
+                self._uninstall(
+                    module.wrapper_dir,
+                    self.settings.wrapper_base,
+                    "$wrapper_base/%s" % module.name,
+                )
 
-        # If uninstalling the entire module, clean up symbolic links in all views
-        for view_name in views_with_module:
-            self.views[view_name].uninstall(module.module_dir)
+            # If uninstalling the entire module, clean up symbolic links in all views
+            for view_name in views_with_module:
+                self.views[view_name].uninstall(module.module_dir)
 
-        # parent of versioned directory has module .version
-        module_dir = os.path.dirname(module.module_dir)
+            # parent of versioned directory has module .version
+            module_dir = os.path.dirname(module.module_dir)
 
-        # update the default version file, if other versions still present
-        if os.path.exists(module_dir):
-            self.versionfile.write(module_dir)
+            # update the default version file, if other versions still present
+            if os.path.exists(module_dir):
+                self.versionfile.write(module_dir)
+
+            name, _, tag = module.name.partition(":")
+            self.inventory.remove(name, tag or None)
 
         return True  # Denoting successful uninstallation
 
@@ -384,11 +428,20 @@ class ModuleBase(BaseClient):
     def _get_module_lookup(self, base, filename, pattern=None):
         """
         A shared function to get a lookup of installed modules or registry entries
+
+        Installed modules come from the inventory instead of a walk of the tree.
         """
+        if base == self.settings.module_base:
+            return self.inventory.modules(pattern, modulefile=filename)
+
         modules = {}
         for fullpath in utils.recursive_find(base, pattern):
             if fullpath.endswith(filename):
                 module_name, version = os.path.dirname(fullpath).rsplit(os.sep, 1)
+
+                # Hidden directories are installs being staged
+                if version.startswith("."):
+                    continue
                 module_name = module_name.replace(base, "").strip(os.sep)
                 if module_name not in modules:
                     modules[module_name] = set()
@@ -404,13 +457,121 @@ class ModuleBase(BaseClient):
         a container, check the digest.
         """
         module = self.get_module(module_name)
-        if not os.path.exists(module.module_dir):
+        tags = self.inventory.tags(module.uri)
+        if not tags or (":" in module_name and module.tag.name not in tags):
             logger.exit(
                 "%s does not exist. Is this a known registry entry?" % module.module_dir
             )
 
         return module.check()
 
+    def check_all(self, jobs=1, remote=False, out=None, as_json=False):
+        """
+        Check all installed modules against the registry, and show or save a report.
+
+        The installed digest of each module and tag comes from the inventory.
+        With remote, the current digest of each tag is also resolved upstream.
+        Registry entries are loaded (and digests resolved) up to jobs at once.
+        """
+        from shpc.main.container.update.docker import DockerImage, get_session
+
+        installed = self.inventory.load()
+
+        def check(name, tag, record):
+            result = {
+                "module": name,
+                "tag": tag,
+                "digest": record.get("digest")
+                or container_digest(name, tag, record.get("container")),
+                "registry_digest": None,
+                "latest": None,
+                "status": "unknown",
+            }
+            try:
+                config = self._load_container(name)
+            except SystemExit:
+                result["error"] = "not found in any registry"
+                return result
+            result["latest"] = config.latest.name
+            registry_tag = config.tags.get(tag)
+            if registry_tag:
+                result["registry_digest"] = registry_tag.digest
+
+            # The digest of the tag now, if we can look it up
+            if remote and config.docker:
+                result["upstream_digest"] = None
+                try:
+                    upstream = DockerImage(config.docker).digest(tag).strip()
+                    result["upstream_digest"] = upstream or None
+                except SystemExit:
+                    result["error"] = "cannot resolve %s:%s" % (config.docker, tag)
+                except Exception as e:
+                    result["error"] = "cannot resolve %s:%s: %s" % (
+                        config.docker,
+                        tag,
+                        e,
+                    )
+
+            # Without the installed digest, or a failed lookup, we cannot tell
+            digests = [result["registry_digest"], result.get("upstream_digest")]
+            if not result["digest"] or not registry_tag or "error" in result:
+                result["status"] = "unknown"
+            elif any(d and d != result["digest"] for d in digests):
+                result["status"] = "digest-drift"
+            elif result["latest"] not in installed[name]:
+                result["status"] = "newer-tag"
+            else:
+                result["status"] = "up-to-date"
+            return result
+
+        todo = [
+            (name, tag, record)
+            for name, tags in sorted(installed.items())
+            for tag, record in sorted(tags.items())
+        ]
+        if remote:
+            get_session(jobs)
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            results = list(executor.map(lambda x: check(*x), todo))
+
+        counts = {"up-to-date": 0, "digest-drift": 0, "newer-tag": 0, "unknown": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        report = {"total": len(results), "remote": remote, **counts, "results": results}
+
+        if out is not None:
+            utils.write_json(report, out)
+        if as_json:
+            print(utils.print_json(report))
+        else:
+            for result in results:
+                name = "%s:%s" % (result["module"], result["tag"])
+                if result["status"] == "digest-drift":
+                    logger.info("👉️ %s requires an update (digest drift). 👈️" % name)
+                elif result["status"] == "newer-tag":
+                    logger.info(
+                        "👉️ %s can be updated to %s! 👈️" % (name, result["latest"])
+                    )
+                elif result["status"] == "unknown":
+                    logger.warning(
+                        "%s cannot be checked: %s"
+                        % (
+                            name,
+                            result.get("error", "the installed digest is not known"),
+                        )
+                    )
+            logger.info(
+                "%s installed modules: %s up to date, %s with digest drift, %s with a newer tag, %s unknown."
+                % (
+                    report["total"],
+                    report["up-to-date"],
+                    report["digest-drift"],
+                    report["newer-tag"],
+                    report["unknown"],
+                )
+            )
+        return report
+
     def new_module(self, name):
         """
         Create a new Module just from a name, which doesn't have to exist in the registry.
@@ -458,37 +619,206 @@ class ModuleBase(BaseClient):
         module = kwargs.get("module") or self.get_module(
             name, container_image=container_image, keep_path=keep_path
         )
+        self._prepare_install(module)
+
+        # Pull the container (if needed) and write the module
+        module.container_path
+        return self._finish_install(module, kwargs.get("features"), force=force)
+
+    def install_many(self, names, jobs=1, callback=None, **kwargs):
+        """
+        Install several recipes, pulling up to jobs containers at once.
 
+        Modules are written as soon as their container is pulled, while other
+        pulls continue, and then callback (if provided) is called with the
+        name and module. Pull output is prefixed with the module name, and we
+        return a lookup of each name to "installed" or the step that failed.
+        A container image (and keep_path) can only be used with install.
+        """
+        for option in ["container_image", "keep_path"]:
+            if kwargs.get(option):
+                logger.exit("%s can only be used to install one recipe." % option)
+
+        results = {}
+        modules = {}
+        for name in dict.fromkeys(names):
+            try:
+                module = self.get_module(name)
+                self._prepare_install(module)
+                modules[name] = module
+            except SystemExit:
+                results[name] = "failed to load"
+
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            futures = {
+                executor.submit(module.add_container, prefix="[%s] " % name): name
+                for name, module in modules.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+
+                # A failed pull is not retried when the module is written
+                step = "pull"
+                try:
+                    if not future.result():
+                        logger.exit("%s: the container was not pulled." % name)
+                    step = "install"
+                    self._finish_install(
+                        modules[name],
+                        kwargs.get("features"),
+                        force=kwargs.get("force", False),
+                    )
+                    step = "update after install"
+                    if callback:
+                        callback(name, modules[name])
+                    results[name] = "installed"
+                except SystemExit:
+                    results[name] = "failed to %s" % step
+                except Exception as e:
+                    logger.error("%s: %s" % (name, e))
+                    results[name] = "failed to %s" % step
+
+        # Results are in the order requested
+        results = {name: results[name] for name in dict.fromkeys(names)}
+        logger.info("Install summary:")
+        for name, result in results.items():
+            logger.info(
+                "  %s %s: %s" % ("✓" if result == "installed" else "✗", name, result)
+            )
+        return results
+
+    def _prepare_install(self, module):
+        """
+        Load overrides and create the module directories before a pull.
+        """
         # We always load overrides for an install
         module.load_override_file()
 
-        # Create the module and container directory
-        utils.mkdirp([module.module_dir, module.container_dir])
+        # Create the container directory (the module directory is staged)
+        utils.mkdirp([module.container_dir])
 
-        # Add a .version file to indicate the level of versioning
-        self.versionfile.write(
-            os.path.join(self.settings.module_base, module.uri), module.tag.name
+    def _finish_install(self, module, features=None, force=False):
+        """
+        Write the module for a pulled container.
+
+        The module file, wrapper scripts and environment file are written to
+        staging directories, and then moved into place together. If nothing
+        they are generated from changed since the last install, they are
+        not written again unless force is True.
+        """
+        with self.locked(module.name):
+            self._write_module(module, features, force=force)
+        if module.touched:
+            logger.info(
+                "Module %s was created (%s files written)."
+                % (module.tagged_name, module.touched)
+            )
+        else:
+            logger.info("Module %s is up to date." % module.tagged_name)
+        return module.container_path
+
+    def _fingerprint(self, module, features=None):
+        """
+        Get a fingerprint of everything the module files are generated from.
+
+        This is the module and wrapper templates, rendered settings, container config
+        (with overrides), the container image and the shpc version.
+        """
+        template_paths = [default_templates]
+        if self.settings.wrapper_scripts.get("templates"):
+            template_paths.insert(0, self.settings.wrapper_scripts["templates"])
+
+        # Wrapper scripts provided alongside the container.yaml
+        scripts = {}
+        tech = (
+            "docker" if self.container.command == "podman" else self.container.command
         )
+        for script in (module.config.get("%s_scripts" % tech) or {}).values():
+            scripts[script] = module.config.load_wrapper_script(
+                self.container.command, script
+            )
+
+        image = {"path": module.container_path, "digest": module.tag.digest}
+        if os.path.exists(module.container_path):
+            st = os.stat(module.container_path)
+            image.update({"inode": st.st_ino, "size": st.st_size})
+            image["mtime"] = st.st_mtime_ns
+
+        # Other settings (e.g., registries or caches) do not change the files
+        settings = {key: self.settings.get(key) for key in rendered_settings}
+        inputs = {
+            "shpc": __version__,
+            "container": self.container.command,
+            "modulefile": self.modulefile,
+            "template": utils.get_file_hash(self.template.get(self.templatefile)),
+            "wrappers": get_templates_digest(tuple(template_paths)),
+            "scripts": scripts,
+            "settings": settings,
+            "config": module.config.entry._config,
+            "image": image,
+            "features": features,
+        }
+        content = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _write_module(self, module, features=None, force=False):
         if not module.container_path:
             utils.remove_to_base(module.container_dir, self.container_base)
             logger.exit("There was an issue pulling the container for %s" % module.name)
 
-        # Get the template based on the module and container type
-        template = self.template.load(self.templatefile)
-        module_path = os.path.join(module.module_dir, self.modulefile)
-
-        # Install the container
-        # This could be simplified to take the module
-        self.container.install(module_path, template, module, kwargs.get("features"))
+        # Skip rendering if the module was generated from the same inputs
+        fingerprint = self._fingerprint(module, features)
+        fingerprint_file = os.path.join(module.module_dir, ".shpc-fingerprint")
+        previous = {}
+        if os.path.exists(fingerprint_file):
+            try:
+                previous = utils.read_json(fingerprint_file)
+            except ValueError:
+                pass
+
+        # Keep the creation date, so unchanged files render the same
+        module.creation_date = previous.get("created")
+        module.touched = 0
+        if (
+            force
+            or previous.get("fingerprint") != fingerprint
+            or not os.path.exists(os.path.join(module.module_dir, self.modulefile))
+            or not os.path.exists(module.wrapper_dir)
+        ):
+            # Get the template based on the module and container type
+            template = self.template.load(self.templatefile)
+
+            module.stage()
+            try:
+                staged_dir = module.staged(module.module_dir)
+                module_path = os.path.join(staged_dir, self.modulefile)
+                module.creation_date = module.creation_date or str(datetime.now())
+
+                # Install the container
+                # This could be simplified to take the module
+                self.container.install(module_path, template, module, features)
+
+                # Write the environment file to be bound to the container
+                module.add_environment()
+                record = {
+                    "fingerprint": fingerprint,
+                    "created": module.creation_date,
+                    "digest": module.tag.digest,
+                }
+                utils.write_json(record, os.path.join(staged_dir, ".shpc-fingerprint"))
+                module.touched = module.promote()
+            finally:
+                module.unstage()
 
         # If the container tech does not need storage, clean up
         if not os.listdir(module.container_dir):
             utils.remove_to_base(module.container_dir, self.container_base)
 
-        # Write the environment file to be bound to the container
-        module.add_environment()
-        logger.info("Module %s was created." % module.tagged_name)
-        return module.container_path
+        # Add a .version file to indicate the level of versioning
+        module.touched += self.versionfile.write(
+            os.path.join(self.settings.module_base, module.uri), module.tag.name
+        )
+        self.inventory.add(module, self.modulefile, digest=module.tag.digest)
 
     def view_install(self, view_name, name, force=False, container_image=None):
         """
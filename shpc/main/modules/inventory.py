@@ -0,0 +1,279 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import copy
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+import shpc.utils as utils
+from shpc.logger import logger
+
+# Module files we find when rebuilding from the tree
+modulefile_regex = "module[.](lua|tcl)$"
+
+# Loaded inventories by path, with the file (inode) and offset read to
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def container_digest(name, tag, container):
+    """
+    Derive the digest of a tag from its container name (<name>-<tag>-<digest>.sif)
+
+    This is for modules installed before the digest was recorded, and we
+    assume only one container per install.
+    """
+    sif = os.path.basename(container or "")
+    prefix = re.sub("(:|[/])", "-", "%s:%s" % (name, tag)) + "-"
+    if sif.startswith(prefix) and sif.endswith(".sif"):
+        return sif[len(prefix) : -len(".sif")] or None
+
+
+class Inventory:
+    """
+    An inventory of installed modules, kept in $module_base/.shpc-inventory.jsonl
+
+    The inventory is a journal, and each install, uninstall or view change
+    appends a line (under a lock) instead of rewriting the file. Reading it
+    replays the journal, and a process only reads lines added since it last
+    looked. If the journal does not exist, it is rebuilt from the tree the
+    next time it is read, and changes until then are not recorded.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    @property
+    def path(self):
+        return os.path.join(self.settings.module_base, ".shpc-inventory.jsonl")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def locked(self):
+        return utils.locked(self.path, self.settings.lock_dir)
+
+    def _append(self, *records):
+        """
+        Add records to the journal, if we have one.
+        """
+        with self.locked():
+            if not self.exists():
+                return
+            content = "".join(json.dumps(record) + "\n" for record in records)
+            try:
+                utils.write_file(self.path, content, mode="a")
+            except OSError as e:
+                logger.warning("Cannot update inventory %s: %s" % (self.path, e))
+
+    def add(self, module, modulefile, digest=None):
+        """
+        Record an installed module.
+        """
+        name, tag = module.uri, module.tag.name
+        record = {
+            "name": name,
+            "tag": tag,
+            "digest": digest,
+            "container": module.container_path,
+            "wrapper_dir": module.wrapper_dir,
+            "modulefile": modulefile,
+        }
+
+        # A reinstall of the same module does not need a new line
+        previous = self.get(name, tag) or {}
+        if previous and all(previous.get(k) == v for k, v in record.items()):
+            return
+        record.update({"op": "install", "installed": str(datetime.now())})
+        self._append(record)
+
+    def remove(self, name, tag=None):
+        """
+        Record an uninstalled module (all tags if tag is None)
+        """
+        self._append({"op": "uninstall", "name": name, "tag": tag})
+
+    def add_view(self, view, name, tag):
+        self._append({"op": "view-add", "view": view, "name": name, "tag": tag})
+
+    def remove_view(self, view, name, tag=None):
+        self._append({"op": "view-remove", "view": view, "name": name, "tag": tag})
+
+    def delete_view(self, view):
+        self._append({"op": "view-delete", "view": view})
+
+    def load(self):
+        """
+        Load the inventory, a lookup of module names to tags and records.
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return self.rebuild()
+
+        with _loaded_lock:
+            ino, offset, modules = _loaded.get(self.path, (None, 0, {}))
+            if ino != st.st_ino or st.st_size < offset:
+                offset, modules = 0, {}
+            if st.st_size > offset:
+                with open(self.path, "r") as fd:
+                    fd.seek(offset)
+                    for line in fd:
+                        # A line still being written is read next time
+                        if not line.endswith("\n"):
+                            break
+                        offset += len(line.encode("utf-8"))
+                        try:
+                            self._replay(modules, json.loads(line))
+                        except (ValueError, KeyError, TypeError):
+                            logger.debug("Skipping invalid inventory line %s" % line)
+            _loaded[self.path] = (st.st_ino, offset, modules)
+            return copy.deepcopy(modules)
+
+    def _replay(self, modules, record):
+        op = record["op"]
+        if op == "install":
+            tags = modules.setdefault(record["name"], {})
+            previous = tags.get(record["tag"]) or {}
+            record = dict(record)
+            record.setdefault("views", previous.get("views", []))
+            del record["op"]
+            tags[record["tag"]] = record
+
+        elif op == "uninstall":
+            tags = modules.get(record["name"], {})
+            for tag in [record["tag"]] if record.get("tag") else list(tags):
+                tags.pop(tag, None)
+            if not tags:
+                modules.pop(record["name"], None)
+
+        elif op in ["view-add", "view-remove"]:
+            tags = modules.get(record["name"], {})
+            for tag in [record["tag"]] if record.get("tag") else list(tags):
+                if tag not in tags:
+                    continue
+                views = [v for v in tags[tag]["views"] if v != record["view"]]
+                if op == "view-add":
+                    views.append(record["view"])
+                tags[tag]["views"] = sorted(views)
+
+        elif op == "view-delete":
+            for tags in modules.values():
+                for entry in tags.values():
+                    if record["view"] in entry["views"]:
+                        entry["views"].remove(record["view"])
+
+    def get(self, name, tag):
+        """
+        Get the record for an installed module and tag.
+        """
+        return self.load().get(name, {}).get(tag)
+
+    def tags(self, name):
+        """
+        Get the installed tags of a module.
+        """
+        return sorted(self.load().get(name, {}))
+
+    def modules(self, pattern=None, modulefile=None):
+        """
+        Get a lookup of installed modules and tags, like listing the tree.
+
+        The pattern is matched against the path of the module file.
+        """
+        modules = {}
+        for name, tags in self.load().items():
+            for tag, record in tags.items():
+                if modulefile and record["modulefile"] != modulefile:
+                    continue
+                fullpath = os.path.join(
+                    self.settings.module_base, name, tag, record["modulefile"]
+                )
+                if pattern and not re.search(pattern, fullpath):
+                    continue
+                modules.setdefault(name, set()).add(tag)
+        return modules
+
+    def scan(self):
+        """
+        Find installed modules in the tree, and the views they are in.
+        """
+        base = self.settings.module_base
+        views = {}
+        views_base = self.settings.views_base
+        if views_base and os.path.exists(views_base):
+            for view in os.listdir(views_base):
+                view_config = os.path.join(views_base, view, "view.yaml")
+                if not os.path.exists(view_config):
+                    continue
+                cfg = utils.read_yaml(view_config) or {}
+                for uid in cfg.get("view", {}).get("modules") or []:
+                    views.setdefault(uid, []).append(view)
+
+        modules = {}
+        if not os.path.exists(base):
+            return modules
+        for fullpath in utils.recursive_find(base, modulefile_regex):
+            module_dir = os.path.dirname(fullpath)
+            name, tag = module_dir.rsplit(os.sep, 1)
+            name = os.path.relpath(name, base)
+
+            # Hidden directories are installs being staged
+            if tag.startswith(".") or name.startswith("."):
+                continue
+
+            previous = {}
+            fingerprint_file = os.path.join(module_dir, ".shpc-fingerprint")
+            if os.path.exists(fingerprint_file):
+                try:
+                    previous = utils.read_json(fingerprint_file)
+                except ValueError:
+                    pass
+
+            container_dir = os.path.join(
+                self.settings.container_base or base, name, tag
+            )
+            containers = []
+            if os.path.exists(container_dir):
+                containers = [
+                    os.path.join(container_dir, x)
+                    for x in os.listdir(container_dir)
+                    if x.endswith(".sif")
+                ]
+            container = containers[0] if containers else None
+            wrapper_dir = os.path.join(self.settings.wrapper_base or base, name, tag)
+            modules.setdefault(name, {})[tag] = {
+                "name": name,
+                "tag": tag,
+                "digest": previous.get("digest")
+                or container_digest(name, tag, container),
+                "container": container,
+                "wrapper_dir": wrapper_dir,
+                "modulefile": os.path.basename(fullpath),
+                "installed": previous.get("created"),
+                "views": sorted(views.get("%s:%s" % (name, tag), [])),
+            }
+        return modules
+
+    def rebuild(self):
+        """
+        Rebuild the inventory from the tree, and return it.
+        """
+        try:
+            with self.locked():
+                modules = self.scan()
+                content = ""
+                for name, tags in sorted(modules.items()):
+                    for tag, record in sorted(tags.items()):
+                        content += json.dumps(dict(record, op="install")) + "\n"
+                utils.mkdir_p(self.settings.module_base)
+                utils.write_file(self.path, content, atomic=True)
+        except OSError as e:
+            # A read only module base can still be listed
+            logger.debug("Cannot save inventory %s: %s" % (self.path, e))
+            return self.scan()
+        return modules
@@ -2,8 +2,10 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+import filecmp
 import os
 import shutil
+import tempfile
 
 import shpc.utils as utils
 from shpc.logger import logger
@@ -23,6 +25,11 @@ class Module:
         self._uri = None
         self._container_dir = None
         self._container_path = None
+        self._staged = {}
+
+        # Files changed by the last install, and the date it was first created
+        self.touched = 0
+        self.creation_date = None
 
     @property
     def tagged_name(self):
@@ -36,7 +43,7 @@ class Module:
         Write the environment to the module directory.
         """
         self.container.add_environment(
-            self.wrapper_dir,
+            self.staged(self.wrapper_dir),
             envars=self.config.get_envars(),
             environment_file=self.settings.environment_file,
         )
@@ -73,11 +80,12 @@ class Module:
             self._container_dir = self.container.container_dir(self.module_basepath)
         return self._container_dir
 
-    def add_container(self, container_image=None):
+    def add_container(self, container_image=None, prefix=None):
         """
         Ensure a container is pulled (or provided)
 
-        This should be called after self.config is set in new_module.
+        This should be called after self.config is set in new_module. A prefix
+        is added to lines of pull output (e.g., when pulling in parallel).
         """
         # First preference goes to provided image (actual file)
         # This is only allowed for Singularity containers
@@ -92,7 +100,11 @@ class Module:
         # there was an error and we cleanup
         if not self._container_path:
             self._container_path = self.container.registry_pull(
-                self.module_dir, self.container_dir, self.config, self.tag
+                self.module_dir,
+                self.container_dir,
+                self.config,
+                self.tag,
+                prefix=prefix,
             )
         return self._container_path
 
@@ -111,7 +123,7 @@ class Module:
         if not os.path.exists(self.container_dir):
             utils.mkdir_p(self.container_dir)
         if not os.path.exists(container_dest):
-            shutil.copyfile(container_image, container_dest)
+            utils.copyfile(container_image, container_dest, atomic=True)
         self._container_path = container_dest
 
     def _add_config_container(self):
@@ -131,7 +143,7 @@ class Module:
         # cannot use a link, and the registry won't be deleted but the
         # module container might!
         if not os.path.exists(container_dest):
-            shutil.copyfile(self._container_path, container_dest)
+            utils.copyfile(self._container_path, container_dest, atomic=True)
         self._container_path = container_dest
 
     @property
@@ -180,6 +192,107 @@ class Module:
         """
         return os.path.join(self.settings.module_base, self.module_basepath)
 
+    def stage(self):
+        """
+        Create staging directories for the module (and wrapper) directory.
+
+        They are siblings on the same filesystem, so promote can move the
+        complete directories into place with a rename.
+        """
+        for dirname in dict.fromkeys([self.module_dir, self.wrapper_dir]):
+            parent = os.path.dirname(dirname)
+            utils.mkdir_p(parent)
+            self._staged[dirname] = tempfile.mkdtemp(
+                prefix=".%s.stage-" % os.path.basename(dirname), dir=parent
+            )
+
+    def staged(self, dirname):
+        """
+        Get the directory to write to for a module directory.
+        """
+        return self._staged.get(dirname, dirname)
+
+    def promote(self):
+        """
+        Move staged directories into place, and return the files changed.
+
+        Wrappers are promoted first, so a module file is never seen without
+        them. If no file changed, the staged directory is dropped. Otherwise
+        the previous directory is moved aside and the staged one moved in,
+        so readers see the old or the new tree (and for a moment between
+        the two renames, neither). A container pulled into the directory,
+        and files that did not change, are linked into the new tree.
+        """
+        touched = 0
+        for dirname in reversed(list(self._staged)):
+            staged = self._staged[dirname]
+            changed = self._link_unchanged(staged, dirname)
+            if os.path.exists(dirname) and not changed:
+                shutil.rmtree(staged)
+                del self._staged[dirname]
+                continue
+
+            container = self._container_path
+            if container and os.path.dirname(container) == dirname:
+                if os.path.lexists(container):
+                    dest = os.path.join(staged, os.path.basename(container))
+                    os.link(container, dest, follow_symlinks=False)
+
+            os.chmod(staged, 0o777 & ~utils.fileio.umask)
+            if os.path.exists(dirname):
+                previous = staged + ".previous"
+                os.rename(dirname, previous)
+                os.rename(staged, dirname)
+                shutil.rmtree(previous)
+            else:
+                os.rename(staged, dirname)
+            touched += changed
+            del self._staged[dirname]
+        return touched
+
+    def _link_unchanged(self, staged, dirname):
+        """
+        Link files with the same content from dirname into staged.
+
+        They keep their inode and modified time in the new tree. Return the
+        number of files that were added, changed or are no longer generated.
+        """
+        changed = 0
+        files = set()
+        for src in list(utils.recursive_find(staged)):
+            relpath = os.path.relpath(src, staged)
+            files.add(relpath)
+            dest = os.path.join(dirname, relpath)
+            if not (
+                os.path.isfile(dest)
+                and os.stat(src).st_mode == os.stat(dest).st_mode
+                and filecmp.cmp(src, dest, shallow=False)
+            ):
+                changed += 1
+                continue
+            try:
+                os.link(dest, src + ".link")
+                os.replace(src + ".link", src)
+            except OSError as e:
+                logger.debug("Cannot link %s: %s" % (dest, e))
+
+        # The container is kept, and other files are no longer generated
+        if self._container_path:
+            files.add(os.path.relpath(self._container_path, dirname))
+        if os.path.isdir(dirname):
+            for path in utils.recursive_find(dirname):
+                if os.path.relpath(path, dirname) not in files:
+                    changed += 1
+        return changed
+
+    def unstage(self):
+        """
+        Remove staged directories that were not promoted (e.g., after an error)
+        """
+        for staged in self._staged.values():
+            shutil.rmtree(staged, ignore_errors=True)
+        self._staged = {}
+
     @property
     def module_basepath(self):
         """
@@ -4,14 +4,87 @@ __license__ = "MPL 2.0"
 
 
 import os
+import threading
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import BaseLoader, Environment, FileSystemBytecodeCache, TemplateNotFound
 
 here = os.path.dirname(os.path.abspath(__file__))
 
 # Allow includes from this directory OR providing strings
 template_dir = os.path.join(here, "templates")
-env = Environment(loader=FileSystemLoader(template_dir))
+
+# Environments (and the templates they compiled) by module name format
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def substitute(template, module_name):
+    """
+    For all known identifiers, substitute user specified format strings.
+    """
+    subs = {"{|module_name|}": module_name}
+    for key, replacewith in subs.items():
+        template = template.replace(key, replacewith)
+    return template
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return
+
+
+class SubstitutionLoader(BaseLoader):
+    """
+    Load a template by path (or name in the templates directory), with
+    user specified format strings substituted.
+    """
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+
+    def get_source(self, environment, template):
+        path = template
+        if not os.path.isabs(path):
+            path = os.path.join(template_dir, template)
+        mtime = get_mtime(path)
+        try:
+            with open(path, "r") as temp:
+                source = temp.read()
+        except OSError:
+            raise TemplateNotFound(template)
+
+        # The compiled template is used until the file changes
+        return (
+            substitute(source, self.module_name),
+            path,
+            lambda: get_mtime(path) == mtime,
+        )
+
+
+def get_environment(module_name, cache_dir=None):
+    """
+    Get the environment for a module name format, shared in this process.
+
+    Compiled templates are kept by the environment, and if we have a cache
+    directory the compiled bytecode is saved there for the next process.
+    """
+    key = (module_name, cache_dir)
+    with _environments_lock:
+        if key not in _environments:
+            bytecode_cache = None
+            if cache_dir:
+                directory = os.path.join(cache_dir, "templates")
+                try:
+                    os.makedirs(directory, exist_ok=True)
+                    bytecode_cache = FileSystemBytecodeCache(directory)
+                except OSError:
+                    pass
+            _environments[key] = Environment(
+                loader=SubstitutionLoader(module_name), bytecode_cache=bytecode_cache
+            )
+        return _environments[key]
 
 
 class Template:
@@ -22,6 +95,10 @@ class Template:
     def __init__(self, settings):
         self.settings = settings
 
+    @property
+    def module_name(self):
+        return self.settings.module_name or "{{ parsed_name.tool }}"
+
     def get(self, template_name):
         """
         Get a template from templates
@@ -34,20 +111,14 @@ class Template:
     def load(self, template_name):
         """
         Load the default module template.
-        """
-        template_file = self.get(template_name)
 
-        with open(template_file, "r") as temp:
-            template = env.from_string(self.substitute(temp.read()))
-        return template
+        Templates are compiled once per process, and the bytecode is cached.
+        """
+        env = get_environment(self.module_name, self.settings.cache_dir)
+        return env.get_template(self.get(template_name))
 
     def substitute(self, template):
         """
         For all known identifiers, substitute user specified format strings.
         """
-        subs = {
-            "{|module_name|}": self.settings.module_name or "{{ parsed_name.tool }}"
-        }
-        for key, replacewith in subs.items():
-            template = template.replace(key, replacewith)
-        return template
+        return substitute(template, self.module_name)
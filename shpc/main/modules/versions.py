@@ -18,32 +18,49 @@ class VersionFile:
         self.module_extension = module_extension
         self.template = templatectl.Template(settings)
 
+    def _write_version(self, version_file, content):
+        """
+        Write a .version file if the content changed, and return the files written.
+        """
+        if os.path.exists(version_file) and utils.read_file(version_file) == content:
+            return 0
+        utils.write_file(version_file, content, atomic=True)
+        return 1
+
     def _no_default_version(self, version_file, tag):
         if self.module_extension == "tcl":
             template = self.template.load("default_version")
-            utils.write_file(version_file, template.render())
+            return self._write_version(version_file, template.render())
         # LMOD (lua) False or null, don't generate a .version file
+        return 0
 
     def _module_sys_default_version(self, version_file, tag):
         if self.module_extension == "lua":
             template = self.template.load("default_version")
-            utils.write_file(version_file, template.render())
+            return self._write_version(version_file, template.render())
         # TCL module_sys or True default version, don't generate a .version file
+        return 0
 
     def _set_default_version(self, version_file, tag):
         """
         Set the default version to the given tag
         """
         template = self.template.load("default_version")
-        utils.write_file(version_file, template.render(version=tag))
+        return self._write_version(version_file, template.render(version=tag))
 
     def write(self, version_dir, latest_tag_installed=None):
         """
         Write a .version file, if there is a template for it.
+
+        Returns the number of files written (0 if it did not change).
         """
+        with utils.locked(version_dir, self.settings.lock_dir):
+            return self._write(version_dir, latest_tag_installed)
+
+    def _write(self, version_dir, latest_tag_installed=None):
         if not os.path.exists(version_dir):
             # Happens when uninstalling the last version of a tool
-            return
+            return 0
 
         version_file = os.path.join(version_dir, ".version")
 
@@ -60,7 +77,7 @@ class VersionFile:
             tag = latest_tag_installed
         else:
             # The versions we actually have
-            found = [x for x in os.listdir(version_dir) if x != ".version"]
+            found = [x for x in os.listdir(version_dir) if not x.startswith(".")]
             if len(found) == 1:
                 tag = found[0]
             else:
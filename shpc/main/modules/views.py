@@ -14,6 +14,7 @@ import shpc.main.schemas as schemas
 import shpc.main.settings as settings
 import shpc.utils as utils
 from shpc.logger import logger
+from shpc.main.modules.inventory import Inventory
 
 # Supported variables and defaults
 supported_view_variables = {"system_modules": [], "depends_on": []}
@@ -113,12 +114,13 @@ class ViewsHandler:
         of params.
         """
         self._variable_checks(view_name, var_name)
-        cfg = self.load_config(view_name)
-        changes, cfg = self._add_variable(var_name, values, cfg)
+        with utils.locked(self.view_config(view_name), self.settings.lock_dir):
+            cfg = self.load_config(view_name)
+            changes, cfg = self._add_variable(var_name, values, cfg)
 
-        # If we have changes, write the view module and updated config
-        if changes:
-            self.save_view_module(view_name, cfg)
+            # If we have changes, write the view module and updated config
+            if changes:
+                self.save_view_module(view_name, cfg)
 
     def _add_variable(self, var_name, values, cfg):
         """
@@ -146,11 +148,12 @@ class ViewsHandler:
         Remove a variable from a view.
         """
         self._variable_checks(view_name, var_name)
-        cfg = self.load_config(view_name)
-        changes, cfg = self._remove_variable(var_name, values, cfg)
-        if changes:
-            self.save_view_module(view_name, cfg)
-        else:
+        with utils.locked(self.view_config(view_name), self.settings.lock_dir):
+            cfg = self.load_config(view_name)
+            changes, cfg = self._remove_variable(var_name, values, cfg)
+            if changes:
+                self.save_view_module(view_name, cfg)
+        if not changes:
             logger.warning("No matches found. No changes were made to the view.")
 
     def _remove_variable(self, var_name, values, cfg):
@@ -228,7 +231,7 @@ class ViewsHandler:
         """
         view_config = self.view_config(name)
         jsonschema.validate(instance=cfg, schema=schemas.views)
-        utils.write_yaml(cfg, view_config)
+        utils.write_yaml(cfg, view_config, atomic=True)
 
     def load_config(self, name):
         """
@@ -256,6 +259,7 @@ class ViewsHandler:
 
         # This should be all symlinks plus the config
         shutil.rmtree(view_root)
+        Inventory(self.settings).delete_view(name)
         logger.info("%s has been deleted." % view_root)
 
     def edit(self, name):
@@ -321,6 +325,12 @@ class View:
         """
         self._config = utils.read_yaml(self.config_path)
 
+    def locked(self):
+        """
+        Lock the view against changes by other shpc processes.
+        """
+        return utils.locked(self.config_path, self.settings.lock_dir)
+
     def symlink_exists(self, module_dir):
         """
         Return True or false if the view to a specific version exists or not.
@@ -412,6 +422,10 @@ class View:
         """
         Install a module to the view, which is a symbolic link.
         """
+        with self.locked():
+            self._install(module_dir)
+
+    def _install(self, module_dir):
         symlink_path = self.get_symlink_path(module_dir)
 
         # If there is a previous link, unlink and re-create it.
@@ -445,7 +459,7 @@ class View:
         Save the config to file, validating first.
         """
         jsonschema.validate(instance=self._config, schema=schemas.views)
-        utils.write_yaml(self._config, self.config_path)
+        utils.write_yaml(self._config, self.config_path, atomic=True)
 
     def add_module(self, module_dir):
         """
@@ -453,33 +467,46 @@ class View:
         list of installed for the view.
         """
         module_uid = self.module_name(module_dir)
-        if module_uid not in self._config["view"]["modules"]:
-            self._config["view"]["modules"].append(module_uid)
-            self.save()
+
+        # Another process can have changed the config since we loaded it
+        with self.locked():
+            self.reload()
+            if module_uid not in self._config["view"]["modules"]:
+                self._config["view"]["modules"].append(module_uid)
+                self.save()
+            Inventory(self.settings).add_view(self.name, *module_uid.split(":", 1))
 
     def remove_module(self, module_dir, has_version=False):
         """
         Given the name of a module directory or path from the main root, remove.
         """
         module_uid = self.module_name(module_dir, has_version)
-        updated = []
-        change = False
-        for module in self._config["view"]["modules"]:
-            # This will match an entire dirname (if all delted) or a specific version
-            if module_uid not in module:
-                updated.append(module)
-            else:
-                change = True
-
-        # Only update if there is a change
-        if change:
-            self._config["view"]["modules"] = updated
-            self.save()
+        with self.locked():
+            self.reload()
+            updated = []
+            change = False
+            for module in self._config["view"]["modules"]:
+                # This will match an entire dirname (if all delted) or a specific version
+                if module_uid not in module:
+                    updated.append(module)
+                else:
+                    change = True
+
+            # Only update if there is a change
+            if change:
+                self._config["view"]["modules"] = updated
+                self.save()
+                name, _, tag = module_uid.partition(":")
+                Inventory(self.settings).remove_view(self.name, name, tag or None)
 
     def create_symlink(self, module_dir):
         """
         Create the symlink if desired by the user!
         """
+        with self.locked():
+            self._create_symlink(module_dir)
+
+    def _create_symlink(self, module_dir):
         symlink_path = self.get_symlink_path(module_dir)
         if os.path.exists(symlink_path):
             os.unlink(symlink_path)
@@ -504,6 +531,10 @@ class View:
         This can either be for a specific version (a lua file) or the entire
         view directory with the module
         """
+        with self.locked():
+            self._uninstall(module_dir)
+
+    def _uninstall(self, module_dir):
         # Case 1: delete a specific symlinked module
         if self.symlink_exists(module_dir):
             self._uninstall_version(module_dir)
@@ -4,7 +4,8 @@ __license__ = "MPL 2.0"
 
 
 import os
-import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import jsonschema
 
@@ -14,22 +15,22 @@ from shpc.logger import logger
 from shpc.main.settings import SettingsBase
 
 from .filesystem import Filesystem, FilesystemResult
+from .lookup import LookupTable
+from .manifest import Manifest, apply_plan, plan_module
 from .remote import GitHub, GitLab
+from .search import SearchIndex
+from .validate import RegistryValidator
 
 
 def update_container_module(module, from_path, existing_path):
     """
-    Update a container module, meaning copying over all files
+    Update a container module, meaning copying over all files that differ
     """
     if not os.path.exists(existing_path):
         shpc.utils.mkdir_p(existing_path)
-    for filename in shpc.utils.recursive_find(from_path):
-        relative_path = filename.replace(from_path, "").strip("/")
-        to_path = os.path.join(existing_path, relative_path)
-        if os.path.exists(to_path):
-            shutil.rmtree(to_path)
-        shpc.utils.mkdir_p(os.path.dirname(to_path))
-        shutil.copy2(filename, to_path)
+    source = Manifest(from_path)
+    dest = Manifest(existing_path)
+    apply_plan(plan_module("", source, dest), source, dest)
 
 
 class Registry:
@@ -44,11 +45,23 @@ class Registry:
         # and they must exist.
         self.registries = [self.get_registry(r) for r in self.settings.registry]
 
+        # Module name to registry, built when we first need it
+        self.lookup = LookupTable(
+            self.registries,
+            cache_dir=self.settings.cache_dir,
+            cache_ttl=int(self.settings.registry_cache_ttl or 0),
+        )
+        self.search_index = SearchIndex(
+            self.registries,
+            cache_dir=self.settings.cache_dir,
+            cache_ttl=int(self.settings.registry_cache_ttl or 0),
+        )
+
     def exists(self, name):
         """
         Determine if a module name *exists* in any local registry, return path
         """
-        for reg in self.registries:
+        for reg in self.lookup.candidates(name):
             if reg.exists(name):
                 return os.path.join(reg.source, name)
 
@@ -70,12 +83,33 @@ class Registry:
             reg = self.get_registry(path)
             return reg.find(name)
 
-        # Otherwise search through default registries
-        for reg in self.registries:
+        # Otherwise search through default registries, owner first
+        for reg in self.lookup.candidates(name):
             result = reg.find(name)
             if result:
                 return result
 
+    def search(self, query, limit=None):
+        """
+        Search names, aliases, descriptions, urls and tags across registries.
+        """
+        return self.search_index.search(query, limit=limit)
+
+    def resolve(self, name):
+        """
+        Resolve a short name (e.g., samtools) to full module names.
+        """
+        return self.search_index.resolve(name)
+
+    def validate(self, jobs=1, force=False):
+        """
+        Validate container.yaml files in filesystem registries, return a report.
+        """
+        validator = RegistryValidator(
+            self.registries, cache_dir=self.settings.cache_dir
+        )
+        return validator.validate(jobs=jobs, force=force)
+
     def iter_modules(self):
         """
         Iterate over modules found across the registry
@@ -92,7 +126,11 @@ class Registry:
         """
         for Registry in PROVIDERS:
             if Registry.matches(source):
-                return Registry(source)
+                return Registry(
+                    source,
+                    cache_dir=self.settings.cache_dir,
+                    cache_ttl=self.settings.registry_cache_ttl,
+                )
         raise ValueError("No matching registry provider for %s" % source)
 
     def sync(
@@ -105,9 +143,14 @@ class Registry:
         local=None,
         config_file=None,
         sync_registry=None,
+        jobs=1,
     ):
         """
         Given a module name (or None for all modules) update container.yaml files.
+
+        With a config file, each local registry is synced from its remote, and
+        with jobs > 1 up to that many pairs are synced at once. Output is then
+        shown per pair when it finishes, followed by a summary.
         """
         if not config_file:
             return self._sync(
@@ -115,8 +158,62 @@ class Registry:
             )
         cfg = shpc.utils.read_yaml(config_file)
         jsonschema.validate(cfg, shpc.main.schemas.extraConfig)
-        for local, sync_registry in cfg["sync_registry"].items():
-            self._sync(name, dryrun, tag, upgrade_all, add_new, local, sync_registry)
+        pairs = list(cfg["sync_registry"].items())
+
+        if jobs <= 1 or len(pairs) < 2:
+            summary = [
+                self._sync(
+                    name, dryrun, tag, upgrade_all, add_new, local, sync_registry
+                )
+                for local, sync_registry in pairs
+            ]
+            self._log_sync_summary(pairs, summary)
+            return summary
+
+        # Pairs that share a remote share a mirror, so they take turns
+        locks = {sync_registry: threading.Lock() for _, sync_registry in pairs}
+
+        def sync_pair(local, sync_registry):
+            lines = []
+            with locks[sync_registry]:
+                result = self._sync(
+                    name,
+                    dryrun,
+                    tag,
+                    upgrade_all,
+                    add_new,
+                    local,
+                    sync_registry,
+                    log=lines.append,
+                    quiet=True,
+                )
+            return result, lines
+
+        summary = [None] * len(pairs)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(sync_pair, local, sync_registry): i
+                for i, (local, sync_registry) in enumerate(pairs)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                summary[i], lines = future.result()
+                logger.info("%s <- %s" % pairs[i])
+                for line in lines:
+                    logger.info("  %s" % line)
+        self._log_sync_summary(pairs, summary)
+        return summary
+
+    def _log_sync_summary(self, pairs, summary):
+        """
+        Show the modules added and upgraded for each local <- remote pair.
+        """
+        logger.info("Sync summary:")
+        for (local, sync_registry), result in zip(pairs, summary):
+            logger.info(
+                "  %s <- %s: %s added, %s upgraded"
+                % (local, sync_registry, len(result["added"]), len(result["upgraded"]))
+            )
 
     def _sync(
         self,
@@ -127,13 +224,17 @@ class Registry:
         add_new=True,
         local=None,
         sync_registry=None,
+        log=None,
+        quiet=False,
     ):
         # Registry to sync from
         sync_registry = sync_registry or self.settings.sync_registry
 
         # Create a remote registry with settings preference
         Remote = GitHub if "github.com" in sync_registry else GitLab
-        remote = Remote(sync_registry, tag=tag)
+        remote = Remote(
+            sync_registry, tag=tag, cache_dir=self.settings.cache_dir, quiet=quiet
+        )
         local = local or self.settings.filesystem_registry
         if not local:
             logger.exit(
@@ -147,30 +248,41 @@ class Registry:
         if not local.is_filesystem_registry:
             logger.exit(
                 "sync is only supported for a remote to a filesystem registry: %s"
-                % sync_registry.source
+                % local.source
             )
 
         # Upgrade the current registry from the remote
-        self.sync_from_remote(
+        result = self.sync_from_remote(
             remote,
             name,
             overwrite=upgrade_all,
             dryrun=dryrun,
             add_new=add_new,
             local=local,
+            log=log,
         )
         remote.cleanup()
+        return result
 
     def sync_from_remote(
-        self, remote, name=None, overwrite=False, dryrun=False, add_new=True, local=None
+        self,
+        remote,
+        name=None,
+        overwrite=False,
+        dryrun=False,
+        add_new=True,
+        local=None,
+        log=None,
     ):
         """
         Update our local filesystem registry with a new module.
 
         If the registry module is not installed, we install to the first
-        filesystem registry found in the list.
+        filesystem registry found in the list. Messages go to log (default
+        logger.info) and we return the lists of added and upgraded modules.
         """
-        updates = False
+        log = log or logger.info
+        result = {"added": [], "upgraded": []}
 
         # A local (string) path provided
         if local and isinstance(local, str) and os.path.exists(local):
@@ -180,36 +292,69 @@ class Registry:
         if not local:
             local = Filesystem(self.settings.filesystem_registry)
 
+        # A remote registry is fetched into a persistent mirror (if we can),
+        # and syncing one module only needs (and checks out) that directory
         tmpdir = remote.source
         if tmpdir.startswith("http") or not os.path.exists(tmpdir):
-            tmpdir = remote.clone()
+            tmpdir = remote.mirror(modules=[name] if name else None)
+
+        # Manifests of content hashes are keyed by the registry root
+        cache_dir = self.settings.cache_dir
+        dest = Manifest(local.source, cache_dir)
+        sources = {}
+
+        # These are modules to update, one module is looked up directly
+        if name:
+            regpath = remote.registry_dir
+            modules = []
+            if os.path.exists(os.path.join(regpath, name, "container.yaml")):
+                modules = [(regpath, name)]
+        else:
+            modules = remote.iter_modules()
+
+        for regpath, module in modules:
+            existing_path = local.exists(module)
 
-        # These are modules to update
-        for regpath, module in remote.iter_modules():
-            if name and module != name:
+            # An existing module is only updated if we want to replace all files
+            if existing_path and not overwrite:
                 continue
 
-            from_path = os.path.join(regpath, module)
-            existing_path = local.exists(module)
+            # If the path doesn't exist, we add it only if we want to add new
+            if not existing_path and not add_new:
+                continue
+
+            if regpath not in sources:
+                sources[regpath] = Manifest(regpath, cache_dir)
+            source = sources[regpath]
+
+            # Only files with changed content are copied
+            plan = plan_module(module, source, dest)
+            if not plan:
+                continue
 
-            # If we have an existing module and we want to replace all files
-            if existing_path and overwrite:
-                updates = True
-                logger.info("%s will be upgraded with all new files." % module)
-                if not dryrun:
-                    update_container_module(module, from_path, existing_path)
-
-            # If the path doesn't exist, we add / update it only if we want to add new
-            elif not existing_path and add_new:
-                updates = True
-                logger.info("%s will be added newly." % module)
-                if not dryrun:
-                    update_container_module(
-                        module, from_path, os.path.join(local.source, module)
-                    )
-
-        if not updates:
-            logger.info("There were no upgrades.")
+            if existing_path:
+                result["upgraded"].append(module)
+                log("%s will be upgraded (%s files)." % (module, len(plan)))
+            else:
+                result["added"].append(module)
+                log("%s will be added newly." % module)
+            for action, relpath, _ in plan:
+                log("  %-6s %s" % (action, relpath))
+            if not dryrun:
+                apply_plan(plan, source, dest)
+
+        for source in list(sources.values()) + [dest]:
+            source.save()
+
+        # New modules can change which registry provides a name
+        if result["added"] and not dryrun:
+            self.lookup.invalidate()
+        if (result["added"] or result["upgraded"]) and not dryrun:
+            self.search_index.invalidate()
+
+        if not result["added"] and not result["upgraded"]:
+            log("There were no upgrades.")
+        return result
 
 
 # We only currently allow Filesystem registries to be used in settings
@@ -3,24 +3,64 @@ __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
 
+import functools
 import os
 import shutil
 
 import shpc.utils
 from shpc.logger import logger
 
+from .index import RegistryIndex
 from .provider import Provider, Result
 
 
+def merge_config(original, updated):
+    """
+    Merge an updated config (plain data) into a round trip loaded original,
+    so that comments are preserved for keys that still exist.
+    """
+    for key in list(original.keys()):
+        if key not in updated:
+            del original[key]
+    for key, value in updated.items():
+        if isinstance(value, dict) and isinstance(original.get(key), dict):
+            merge_config(original[key], value)
+        else:
+            original[key] = value
+    return original
+
+
 class FilesystemResult(Result):
     """
     A filesystem result provides courtesy functions for interacting with
     a container yaml recipe on the filesytem.
     """
 
-    def __init__(self, module, container_yaml):
+    def __init__(
+        self, module, container_yaml, config=None, cache_dir=None, loader=None
+    ):
         self.module = module
-        self.load(container_yaml)
+        self.cache_dir = cache_dir
+
+        # A config provided from the registry index is already loaded, and
+        # with a loader the config is only loaded when it is first used
+        self._loader = loader
+        self._loaded_config = config
+        if config is not None or loader is not None:
+            self.package_file = os.path.abspath(container_yaml)
+        else:
+            self.load(container_yaml)
+
+    @property
+    def _config(self):
+        if self._loaded_config is None and self._loader is not None:
+            self._loaded_config = self._loader()
+            self._loader = None
+        return self._loaded_config
+
+    @_config.setter
+    def _config(self, config):
+        self._loaded_config = config
 
     def load(self, package_file):
         """
@@ -30,9 +70,9 @@ class FilesystemResult(Result):
         if not os.path.exists(package_file):
             logger.exit("%s does not exist." % package_file)
 
-        # Default to round trip so we can save comments
+        # Load plain data, the round trip load (with comments) is done on save
         self.package_file = os.path.abspath(package_file)
-        self._config = shpc.utils.read_yaml(package_file)
+        self._config = shpc.utils.read_yaml_cached(package_file, self.cache_dir)
 
     def get_overrides(self, tag):
         """
@@ -42,14 +82,19 @@ class FilesystemResult(Result):
         override_file = os.path.join(self.dirname, overrides[tag])
         if not os.path.exists(override_file):
             logger.exit(f"Override file {override_file} does not exist.")
-        return shpc.utils.read_yaml(override_file)
+        return shpc.utils.read_yaml_cached(override_file, self.cache_dir)
 
     def save(self, package_file):
         """
         Save the new package file to container.yaml
         """
         package_file = package_file or self.package_file
-        shpc.utils.write_yaml(self._config, package_file)
+        config = self._config
+
+        # Merge changes into a round trip load of the original to preserve comments
+        if os.path.exists(self.package_file):
+            config = merge_config(shpc.utils.read_yaml(self.package_file), config)
+        shpc.utils.write_yaml(config, package_file)
 
     def load_wrapper_script(self, container_tech, script):
         """
@@ -78,11 +123,34 @@ class Filesystem(Provider):
         super().__init__(*args, **kwargs)
         self.source = os.path.abspath(self.source)
 
+        # A persistent index is used when we are given a cache directory
+        self.index = None
+        self.cache_dir = kwargs.get("cache_dir")
+        if self.cache_dir:
+            self.index = RegistryIndex(self.source, self.cache_dir)
+
     @classmethod
     def matches(cls, source):
         return os.path.exists(source) or source == "."
 
+    @property
+    def has_index(self):
+        return self.index is not None and self.index.available
+
+    def exists(self, name):
+        """
+        Determine if a module (or other path) exists in the registry.
+        """
+        if self.has_index and self.index.contains(name):
+            return True
+        return super().exists(name)
+
     def iter_modules(self):
+        if self.has_index:
+            for module in self.index.modules():
+                yield self.source, module
+            return
+
         for filename in shpc.utils.recursive_find(self.source, "container.yaml"):
             module = os.path.dirname(filename).replace(self.source, "").strip(os.sep)
             if not module:
@@ -95,8 +163,16 @@ class Filesystem(Provider):
         """
         # STOPPED HERE - test is failing when remote=True and don't know why
         container_yaml = os.path.join(self.source, name, "container.yaml")
+        if self.has_index:
+            config = self.index.get(name)
+            if config is not None:
+                return FilesystemResult(
+                    name, container_yaml, config=config, cache_dir=self.cache_dir
+                )
+            return
+
         if os.path.exists(container_yaml):
-            return FilesystemResult(name, container_yaml)
+            return FilesystemResult(name, container_yaml, cache_dir=self.cache_dir)
 
     def cleanup(self):
         """
@@ -104,15 +180,34 @@ class Filesystem(Provider):
         """
         if os.path.exists(self.source):
             shutil.rmtree(self.source)
+        if self.index is not None:
+            self.index.delete()
 
     def iter_registry(self, filter_string=None):
         """
         Iterate over content in filesystem registry.
         """
+        if self.has_index:
+            for module_name, filename in self.index.paths(filter_string):
+                yield FilesystemResult(
+                    module_name,
+                    filename,
+                    cache_dir=self.cache_dir,
+                    loader=functools.partial(self.index.get, module_name),
+                )
+            return
+
         for filename in shpc.utils.recursive_find(self.source, filter_string):
             if not filename.endswith("container.yaml"):
                 continue
             module_name = (
                 os.path.dirname(filename).replace(self.source, "").strip(os.sep)
             )
-            yield FilesystemResult(module_name, filename)
+            yield FilesystemResult(
+                module_name,
+                filename,
+                cache_dir=self.cache_dir,
+                loader=functools.partial(
+                    shpc.utils.read_yaml_cached, filename, self.cache_dir
+                ),
+            )
@@ -0,0 +1,214 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import threading
+
+import shpc.utils
+from shpc.logger import logger
+
+# Bump when the layout of the index database changes
+schema_version = "1"
+
+
+class RegistryIndex:
+    """
+    A persistent index of container.yaml files in a filesystem registry.
+
+    Entries are keyed by module path and the container.yaml mtime and size,
+    and store the parsed config. A refresh only re-parses entries whose
+    container.yaml has changed since the last time it was seen.
+    """
+
+    def __init__(self, source, cache_dir):
+        self.source = source
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+        self.db_path = os.path.join(cache_dir, "registry", "%s.db" % digest)
+        self._local = threading.local()
+        self._disabled = False
+        self._refreshed = False
+
+    @property
+    def available(self):
+        """
+        Determine if the index database can be used (e.g., the cache is writable)
+        """
+        if self._disabled:
+            return False
+        try:
+            self.db
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Registry index %s cannot be used: %s" % (self.db_path, e))
+            self._disabled = True
+        return not self._disabled
+
+    @property
+    def db(self):
+        """
+        Connect to (and if needed, create) the index database.
+
+        A connection can only be used by the thread that made it, so each
+        thread (e.g., loading recipes in parallel) has its own.
+        """
+        if getattr(self._local, "db", None) is not None:
+            return self._local.db
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = db.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        if not row or row[0] != schema_version:
+            with db:
+                db.execute("DROP TABLE IF EXISTS entries")
+                db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                    (schema_version,),
+                )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(module TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, config BLOB)"
+        )
+        self._local.db = db
+        return db
+
+    def container_yaml(self, module):
+        return os.path.join(self.source, module, "container.yaml")
+
+    def _parse(self, filename):
+        """
+        Parse a container.yaml into plain data to store in the index.
+        """
+        return pickle.dumps(
+            shpc.utils.read_yaml_safe(filename), protocol=pickle.HIGHEST_PROTOCOL
+        )
+
+    def _stat(self, filename):
+        try:
+            st = os.stat(filename)
+        except FileNotFoundError:
+            return
+        return st.st_mtime_ns, st.st_size
+
+    def refresh(self, force=False):
+        """
+        Walk the registry and re-parse only container.yaml files that changed.
+
+        A refresh is done once per index instance unless force is True.
+        """
+        if self._refreshed and not force:
+            return
+        known = {
+            module: (mtime, size)
+            for module, mtime, size in self.db.execute(
+                "SELECT module, mtime, size FROM entries"
+            )
+        }
+        seen = set()
+        changed = []
+        for root, _, files in os.walk(self.source):
+            if "container.yaml" not in files:
+                continue
+            module = os.path.relpath(root, self.source)
+            if module == ".":
+                continue
+            stat = self._stat(os.path.join(root, "container.yaml"))
+            if not stat:
+                continue
+            seen.add(module)
+            if known.get(module) != stat:
+                changed.append((module, stat))
+
+        removed = [(module,) for module in known if module not in seen]
+        if changed or removed:
+            logger.debug(
+                "Registry index %s: %s changed, %s removed"
+                % (self.source, len(changed), len(removed))
+            )
+        with self.db:
+            for module, (mtime, size) in changed:
+                config = self._parse(self.container_yaml(module))
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                    (module, mtime, size, config),
+                )
+            self.db.executemany("DELETE FROM entries WHERE module=?", removed)
+        self._refreshed = True
+
+    def _lookup(self, module, load=True):
+        """
+        Return the row for one module, re-parsing it only if it changed.
+        """
+        stat = self._stat(self.container_yaml(module))
+        if not stat:
+            with self.db:
+                self.db.execute("DELETE FROM entries WHERE module=?", (module,))
+            return
+
+        column = "config" if load else "NULL"
+        row = self.db.execute(
+            "SELECT mtime, size, %s FROM entries WHERE module=?" % column, (module,)
+        ).fetchone()
+        if row and (row[0], row[1]) == stat:
+            return row[2]
+
+        config = self._parse(self.container_yaml(module))
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (module, stat[0], stat[1], config),
+            )
+        return config
+
+    def contains(self, module):
+        """
+        Determine if a module is a (current) entry in the registry.
+        """
+        if not os.path.exists(self.container_yaml(module)):
+            return False
+        self._lookup(module, load=False)
+        return True
+
+    def get(self, module):
+        """
+        Get the parsed config for a module, or None if it does not exist.
+        """
+        config = self._lookup(module)
+        if config is not None:
+            return pickle.loads(config)
+
+    def modules(self):
+        """
+        Return the sorted list of module names in the registry.
+        """
+        self.refresh()
+        return [
+            row[0]
+            for row in self.db.execute("SELECT module FROM entries ORDER BY module")
+        ]
+
+    def paths(self, filter_string=None):
+        """
+        Yield module and container.yaml path, optionally filtered.
+
+        The filter is a regular expression matched against the container.yaml path.
+        """
+        for module in self.modules():
+            filename = self.container_yaml(module)
+            if filter_string and not re.search(filter_string, filename):
+                continue
+            yield module, filename
+
+    def delete(self):
+        """
+        Remove the index database.
+        """
+        if getattr(self._local, "db", None) is not None:
+            self._local.db.close()
+            self._local.db = None
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
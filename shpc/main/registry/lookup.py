@@ -0,0 +1,164 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+
+import hashlib
+import json
+import os
+import time
+
+import shpc.utils
+from shpc.logger import logger
+
+
+class CachedTable:
+    """
+    A table built from the registries and saved to the cache (if we have one).
+
+    It is rebuilt after the cache ttl, when the list of registries changes,
+    or when a registry reports a new stamp (e.g., a remote library ETag).
+    """
+
+    # Used to name the saved table
+    kind = "table"
+
+    def __init__(self, registries, cache_dir=None, cache_ttl=0):
+        self.registries = registries
+        self.sources = [reg.source for reg in registries]
+        self.cache_ttl = cache_ttl
+        self.path = None
+        if cache_dir:
+            digest = hashlib.sha256(json.dumps(self.sources).encode("utf-8"))
+            self.path = os.path.join(
+                cache_dir,
+                "registry",
+                "%s-%s.json" % (self.kind, digest.hexdigest()[:16]),
+            )
+        self._table = None
+
+    @property
+    def table(self):
+        """
+        Load the table from the cache, or build it.
+        """
+        if self._table is None:
+            self._table = self._load()
+        if self._table is None:
+            self._table = self._build()
+            self._table.update(
+                {
+                    "sources": self.sources,
+                    "stamps": self.stamps(),
+                    "built_at": time.time(),
+                }
+            )
+            self._save(self._table)
+        return self._table
+
+    def stamps(self):
+        """
+        Markers that change with the contents of each registry (if known)
+        """
+        return [reg.stamp() for reg in self.registries]
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            table = shpc.utils.read_json(self.path)
+        except (OSError, ValueError):
+            return
+        if table.get("sources") != self.sources:
+            return
+        if table.get("stamps") != self.stamps():
+            return
+        if time.time() - table.get("built_at", 0) >= self.cache_ttl:
+            return
+        return table
+
+    def _save(self, table):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            shpc.utils.write_file(self.path, json.dumps(table), atomic=True)
+        except OSError as e:
+            logger.warning("Cannot save %s %s: %s" % (self.kind, self.path, e))
+
+    def invalidate(self):
+        """
+        Remove the table, e.g., after modules were added to a registry.
+
+        Parallel syncs can invalidate at once, so it may already be gone.
+        """
+        self._table = None
+        if not self.path:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class LookupTable(CachedTable):
+    """
+    A merged table of module names to the registry that provides them.
+
+    Registries are given in priority order, and the first registry with
+    a module wins. Modules provided by more than one registry are kept as
+    shadowed.
+    """
+
+    kind = "lookup"
+
+    @property
+    def modules(self):
+        return self.table["modules"]
+
+    @property
+    def shadowed(self):
+        """
+        Modules provided by more than one registry, with the sources that lose.
+        """
+        return {
+            name: [self.sources[i] for i in indices]
+            for name, indices in self.table["shadowed"].items()
+        }
+
+    def _build(self):
+        """
+        Build the table from each registry, in priority order.
+        """
+        modules = {}
+        shadowed = {}
+        for i, reg in enumerate(self.registries):
+            for name in reg.iter_names():
+                if name in modules:
+                    shadowed.setdefault(name, []).append(i)
+                else:
+                    modules[name] = i
+
+        if shadowed:
+            logger.info(
+                "%s module(s) found in more than one registry, the first registry is used: %s"
+                % (len(shadowed), ", ".join(sorted(shadowed)))
+            )
+        return {"modules": modules, "shadowed": shadowed}
+
+    def candidates(self, name):
+        """
+        Yield registries to look for a module in, in priority order.
+
+        Remote registries are trusted from the table (it is rebuilt when their
+        library changes) so they are only asked if they provide the module.
+        Filesystem registries can gain or lose a module after the table was
+        built, and checking one is cheap, so they are always asked.
+        """
+        owners = [self.modules.get(name)] + self.table["shadowed"].get(name, [])
+        for i, reg in enumerate(self.registries):
+            if i in owners or reg.is_filesystem_registry:
+                yield reg
@@ -0,0 +1,125 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+
+import hashlib
+import json
+import os
+import shutil
+
+import shpc.utils
+from shpc.logger import logger
+
+
+class Manifest:
+    """
+    A manifest of content hashes for the files under a root directory.
+
+    Hashes are saved (if we have a cache directory) keyed by the relative
+    path, modified time and size of each file, so a file is only read and
+    hashed again when it has changed.
+    """
+
+    def __init__(self, root, cache_dir=None):
+        self.root = os.path.abspath(root)
+        self.path = None
+        if cache_dir:
+            digest = hashlib.sha256(self.root.encode("utf-8")).hexdigest()[:16]
+            self.path = os.path.join(cache_dir, "manifests", "%s.json" % digest)
+        self._files = self._load()
+        self._changed = False
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            return shpc.utils.read_json(self.path)
+        except (OSError, ValueError):
+            return {}
+
+    def _stat(self, relpath):
+        st = os.stat(os.path.join(self.root, relpath))
+        return st.st_mtime_ns, st.st_size
+
+    def hash(self, relpath):
+        """
+        Get the content hash of a file, or None if it does not exist.
+        """
+        try:
+            mtime, size = self._stat(relpath)
+        except FileNotFoundError:
+            self.forget(relpath)
+            return
+        known = self._files.get(relpath)
+        if known and known[0] == mtime and known[1] == size:
+            return known[2]
+        digest = shpc.utils.get_file_hash(os.path.join(self.root, relpath))
+        self._files[relpath] = [mtime, size, digest]
+        self._changed = True
+        return digest
+
+    def record(self, relpath, digest):
+        """
+        Record the hash of a file we just wrote.
+        """
+        mtime, size = self._stat(relpath)
+        self._files[relpath] = [mtime, size, digest]
+        self._changed = True
+
+    def forget(self, relpath):
+        if self._files.pop(relpath, None):
+            self._changed = True
+
+    def files(self, subdir=""):
+        """
+        Yield relative paths of files under a subdirectory of the root.
+        """
+        dirname = os.path.join(self.root, subdir)
+        for filename in shpc.utils.recursive_find(dirname):
+            yield os.path.relpath(filename, self.root)
+
+    def save(self):
+        """
+        Save the manifest to the cache, if we have one and it has changed.
+        """
+        if not self.path or not self._changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            shpc.utils.write_file(self.path, json.dumps(self._files), atomic=True)
+            self._changed = False
+        except OSError as e:
+            logger.warning("Cannot save manifest %s: %s" % (self.path, e))
+
+
+def plan_module(module, source, dest):
+    """
+    Plan the file changes to make a module in dest match source.
+
+    Returns a list of (action, relative path, hash) where action is "add"
+    or "update", and only includes files with different content.
+    """
+    plan = []
+    for relpath in source.files(module):
+        digest = source.hash(relpath)
+        existing = dest.hash(relpath)
+        if existing == digest:
+            continue
+        plan.append(("update" if existing else "add", relpath, digest))
+    return plan
+
+
+def apply_plan(plan, source, dest):
+    """
+    Copy the planned files from source to dest, recording new hashes.
+    """
+    for _, relpath, digest in plan:
+        to_path = os.path.join(dest.root, relpath)
+
+        # We can be replacing a directory with a file
+        if os.path.isdir(to_path) and not os.path.islink(to_path):
+            shutil.rmtree(to_path)
+        shpc.utils.mkdir_p(os.path.dirname(to_path))
+        shutil.copy2(os.path.join(source.root, relpath), to_path)
+        dest.record(relpath, digest)
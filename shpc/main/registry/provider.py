@@ -42,6 +42,13 @@ class Provider:
     def exists(self, name):
         return os.path.exists(os.path.join(self.source, name))
 
+    @property
+    def registry_dir(self):
+        """
+        The directory with registry entries.
+        """
+        return self.source
+
     @property
     def is_filesystem_registry(self):
         return not self.source.startswith("http") and os.path.exists(self.source)
@@ -65,3 +72,16 @@ class Provider:
 
     def iter_modules(self):
         pass
+
+    def stamp(self):
+        """
+        A marker that changes with the contents of the registry, if we have one.
+        """
+        return None
+
+    def iter_names(self):
+        """
+        Yield the names of modules in the registry.
+        """
+        for _, module in self.iter_modules():
+            yield module
@@ -3,10 +3,14 @@ __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
 
+import hashlib
+import json
 import os
 import re
+import shutil
 import subprocess as sp
 import sys
+import time
 
 import requests
 
@@ -82,6 +86,13 @@ class VersionControl(Provider):
 
         # E.g., subdirectory with registry files
         self.subdir = kwargs.get("subdir")
+
+        # On-disk copy of the library, and seconds before we revalidate it
+        self.cache_dir = kwargs.get("cache_dir")
+        self.cache_ttl = int(kwargs.get("cache_ttl") or 0)
+
+        # Don't show git progress (e.g., when syncing in parallel)
+        self.quiet = kwargs.get("quiet", False)
         super().__init__(*args, **kwargs)
         self._url = self.source
 
@@ -120,39 +131,136 @@ class VersionControl(Provider):
             repo,
         )
 
+    @property
+    def registry_dir(self):
+        """
+        The directory with registry entries (the source, or a subdirectory)
+        """
+        if self.subdir:
+            return os.path.join(self.source, self.subdir)
+        return self.source
+
     def exists(self, name):
         """
         Determine if a module exists in the registry.
         """
-        dirname = self.source
-        if self.subdir:
-            dirname = os.path.join(dirname, self.subdir)
-        return os.path.exists(os.path.join(dirname, name))
+        return os.path.exists(os.path.join(self.registry_dir, name))
+
+    def _sparse_paths(self, modules):
+        """
+        Paths in the repository for a sparse checkout of modules.
+        """
+        if not modules:
+            return
+        return [os.path.join(self.subdir or "", module) for module in modules]
 
-    def clone(self, tmpdir=None):
+    def clone(self, tmpdir=None, modules=None):
         """
         Clone the known source URL to a temporary directory
+
+        If modules are provided, we do a partial clone (no blobs) with a
+        sparse checkout of just those module directories.
         """
         tmpdir = tmpdir or shpc.utils.get_tmpdir()
+        paths = self._sparse_paths(modules)
 
         cmd = ["git", "clone", "--depth", "1"]
+        if self.quiet:
+            cmd.append("--quiet")
+        if paths:
+            cmd += ["--filter=blob:none", "--sparse"]
         if self.tag:
             cmd += ["-b", self.tag]
         cmd += [self._url, tmpdir]
         self.source = tmpdir
         try:
             sp.run(cmd, check=True)
+            if paths:
+                sp.run(
+                    ["git", "-C", tmpdir, "sparse-checkout", "set"] + paths, check=True
+                )
         except sp.CalledProcessError as e:
             raise ValueError("Failed to clone repository {}:\n{}", self.source, e)
         return tmpdir
 
+    @property
+    def mirror_dir(self):
+        """
+        Persistent local mirror of the repository, if we have a cache.
+        """
+        if not self.cache_dir:
+            return
+        digest = hashlib.sha256(self._url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "mirrors", digest)
+
+    def mirror(self, modules=None):
+        """
+        Update (or create) the persistent mirror and use it as the source.
+
+        An existing mirror only fetches what changed for the tag. Without
+        a cache directory we fall back to a temporary clone. If modules are
+        provided, a new mirror is a sparse checkout of just those modules,
+        and an existing sparse mirror adds them.
+        """
+        mirror_dir = self.mirror_dir
+        if not mirror_dir:
+            return self.clone(modules=modules)
+
+        # Other processes (or users) with the same cache can update it too
+        with shpc.utils.locked(mirror_dir, os.path.dirname(mirror_dir)):
+            return self._update_mirror(mirror_dir, modules)
+
+    def _update_mirror(self, mirror_dir, modules=None):
+        """
+        Fetch into an existing mirror, or clone it again (under the lock)
+        """
+        if os.path.exists(os.path.join(mirror_dir, ".git")):
+            ref = self.tag or "HEAD"
+            git = ["git", "-C", mirror_dir]
+            paths = self._sparse_paths(modules)
+            try:
+                fetch = ["fetch", "--depth", "1"] + (["--quiet"] if self.quiet else [])
+                sp.run(git + fetch + ["origin", ref], check=True)
+                sp.run(git + ["reset", "--quiet", "--hard", "FETCH_HEAD"], check=True)
+                sp.run(git + ["clean", "--quiet", "-ffdx"], check=True)
+
+                # A sparse mirror gets new modules, or the entire tree
+                sparse = sp.run(
+                    git + ["config", "--get", "core.sparseCheckout"],
+                    stdout=sp.PIPE,
+                    universal_newlines=True,
+                )
+                if sparse.stdout.strip() == "true":
+                    if paths:
+                        sp.run(git + ["sparse-checkout", "add"] + paths, check=True)
+                    else:
+                        sp.run(git + ["sparse-checkout", "disable"], check=True)
+                self.source = mirror_dir
+                return mirror_dir
+            except sp.CalledProcessError as e:
+                logger.warning(
+                    "Cannot update mirror %s, cloning again: %s" % (mirror_dir, e)
+                )
+
+        if os.path.exists(mirror_dir):
+            shutil.rmtree(mirror_dir)
+        os.makedirs(os.path.dirname(mirror_dir), exist_ok=True)
+        return self.clone(mirror_dir, modules=modules)
+
+    def cleanup(self):
+        """
+        Remove a temporary clone (the persistent mirror is kept)
+        """
+        if self.source == self._url or self.source == self.mirror_dir:
+            return
+        if os.path.exists(self.source):
+            shutil.rmtree(self.source)
+
     def iter_modules(self):
         """
         yield module names
         """
-        dirname = self.source
-        if self.subdir:
-            dirname = os.path.join(dirname, self.subdir)
+        dirname = self.registry_dir
 
         # Find modules based on container.yaml
         for filename in shpc.utils.recursive_find(dirname, "container.yaml"):
@@ -161,6 +269,16 @@ class VersionControl(Provider):
                 continue
             yield dirname, module
 
+    def iter_names(self):
+        """
+        Yield module names from a clone, or otherwise the library.
+        """
+        if os.path.exists(self.source):
+            yield from super().iter_names()
+            return
+        self._update_cache()
+        yield from self._cache
+
     def find(self, name):
         """
         Find a particular entry in a registry
@@ -169,21 +287,143 @@ class VersionControl(Provider):
         if name in self._cache:
             return RemoteResult(name, self._cache[name])
 
+    def stamp(self):
+        """
+        The ETag (or modified time) of the cached library, if we have one.
+        """
+        meta = self._load_library_cache()
+        if self.is_filesystem_registry or not meta:
+            return
+        if meta.get("etag") or meta.get("last_modified"):
+            return meta.get("etag") or meta.get("last_modified")
+        return os.stat(self.library_cache + ".json").st_mtime_ns
+
+    @property
+    def library_cache(self):
+        """
+        Prefix for the on-disk copy of the library (and metadata), if caching.
+        """
+        if not self.cache_dir:
+            return
+        digest = hashlib.sha256(self.web_url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "remote", digest)
+
+    def _load_library_cache(self):
+        """
+        Load the on-disk library metadata, or an empty dict if we don't have it.
+        """
+        if not self.library_cache:
+            return {}
+        try:
+            meta = shpc.utils.read_json(self.library_cache + ".meta.json")
+            if os.path.exists(self.library_cache + ".json"):
+                return meta
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _read_library_cache(self):
+        """
+        Read the cached library, or None if it cannot be read (e.g., truncated)
+        """
+        try:
+            return shpc.utils.read_json(self.library_cache + ".json")
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot read cache of %s: %s" % (self.web_url, e))
+
+    def _save_library_cache(self, response):
+        """
+        Save the library response to disk with metadata for revalidation.
+        """
+        if not self.library_cache:
+            return
+        meta = {
+            "url": self.web_url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        try:
+            os.makedirs(os.path.dirname(self.library_cache), exist_ok=True)
+            shpc.utils.write_file(
+                self.library_cache + ".json", response.content, mode="wb", atomic=True
+            )
+            self._touch_library_cache(meta)
+        except OSError as e:
+            logger.warning("Cannot save cache of %s: %s" % (self.web_url, e))
+
+    def _touch_library_cache(self, meta):
+        """
+        Record that the cached library was (re)validated now.
+        """
+        meta["fetched_at"] = time.time()
+        try:
+            shpc.utils.write_file(
+                self.library_cache + ".meta.json", json.dumps(meta), atomic=True
+            )
+        except OSError as e:
+            logger.warning("Cannot save cache of %s: %s" % (self.web_url, e))
+
     def _update_cache(self, force=False):
         """
         Update local cache from a registry.
+
+        If we have a cache directory, the library is kept on disk and only
+        revalidated (If-None-Match / If-Modified-Since) once the cache ttl
+        has expired. If the remote cannot be reached, a stale copy is used.
         """
         if self._cache and not force:
             return
 
+        # A cached library we cannot read is fetched again (unconditionally)
+        meta = self._load_library_cache()
+        library = self._read_library_cache() if meta else None
+        if library is None:
+            meta = {}
+
+        fetched_at = meta.get("fetched_at", 0)
+        if meta and not force and time.time() - fetched_at < self.cache_ttl:
+            self._cache = library
+            return
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
         # Check for exposed library API on GitHub or GitLab pages
-        response = requests.get(self.web_url)
-        if response.status_code != 200:
+        try:
+            response = requests.get(self.web_url, headers=headers, timeout=60)
+        except requests.exceptions.RequestException as e:
+            logger.debug("Request to %s failed: %s" % (self.web_url, e))
+            response = None
+
+        # The cached library is still current
+        if meta and response is not None and response.status_code == 304:
+            self._touch_library_cache(meta)
+            self._cache = library
+
+        elif response is not None and response.status_code == 200:
+            self._cache = response.json()
+            self._save_library_cache(response)
+
+        # Stale while error - better an old library than no library
+        elif meta:
+            logger.warning(
+                "Remote %s is not available, using library cached %s."
+                % (
+                    self.web_url,
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(fetched_at)),
+                )
+            )
+            self._cache = library
+
+        else:
             sys.exit(
                 "Remote %s is not deploying a Registry API (%s). Open a GitHub issue to ask for help."
                 % (self.source, self.web_url)
             )
-        self._cache = response.json()
 
     def iter_registry(self, filter_string=None):
         """
@@ -0,0 +1,106 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+
+import re
+
+from .lookup import CachedTable
+
+# Weight of a term by where it was found in an entry
+weights = {
+    "tool": 20,
+    "name": 10,
+    "alias": 5,
+    "url": 2,
+    "tag": 1,
+    "description": 1,
+}
+
+
+def tokenize(text):
+    """
+    Split text into lowercase terms (letters and numbers).
+    """
+    return [x for x in re.split("[^a-z0-9]+", str(text).lower()) if x]
+
+
+class SearchIndex(CachedTable):
+    """
+    An inverted index of terms to modules, for search and short names.
+
+    Terms come from each entry's name, aliases, description, url and tags,
+    weighted by where they were found. The short (tool) name of each module
+    is also kept, so "samtools" can resolve to its full module name.
+    """
+
+    kind = "search"
+
+    def _build(self):
+        terms = {}
+        tools = {}
+
+        def add(term, module, where):
+            postings = terms.setdefault(term, {})
+            postings[module] = max(postings.get(module, 0), weights[where])
+
+        for reg in self.registries:
+            for entry in reg.iter_registry():
+                module = entry.module
+                config = entry._config or {}
+                tool = module.rsplit("/", 1)[-1].lower()
+                if module not in tools.setdefault(tool, []):
+                    tools[tool].append(module)
+
+                add(tool, module, "tool")
+                for term in tokenize(module):
+                    add(term, module, "name")
+
+                aliases = config.get("aliases") or {}
+                if isinstance(aliases, list):
+                    aliases = {x.get("name"): x.get("command") for x in aliases}
+                for alias in aliases:
+                    add(str(alias).lower(), module, "alias")
+                    for term in tokenize(alias):
+                        add(term, module, "alias")
+
+                for term in tokenize(config.get("url") or ""):
+                    add(term, module, "url")
+                for term in tokenize(config.get("description") or ""):
+                    add(term, module, "description")
+                for key in ["latest", "tags"]:
+                    for tag in config.get(key) or {}:
+                        add(str(tag).lower(), module, "tag")
+
+        return {"terms": terms, "tools": tools}
+
+    def search(self, query, limit=None):
+        """
+        Return (module, score) for modules matching all query terms, best first.
+
+        A term matches exactly, or (with half the weight) as a prefix.
+        """
+        terms = self.table["terms"]
+        scores = None
+        for word in tokenize(query):
+            matches = dict(terms.get(word, {}))
+            for term, postings in terms.items():
+                if term != word and term.startswith(word):
+                    for module, weight in postings.items():
+                        matches[module] = max(matches.get(module, 0), weight / 2)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {
+                    module: score + matches[module]
+                    for module, score in scores.items()
+                    if module in matches
+                }
+        results = sorted((scores or {}).items(), key=lambda x: (-x[1], x[0]))
+        return results[:limit] if limit else results
+
+    def resolve(self, name):
+        """
+        Resolve a short (tool) name to the full module names that provide it.
+        """
+        return self.table["tools"].get(name.lower(), [])
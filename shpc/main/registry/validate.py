@@ -0,0 +1,128 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import shpc.main.schemas as schemas
+import shpc.utils
+from shpc.logger import logger
+from shpc.main.container.config import get_validator
+
+# Files that passed are only skipped for the same schema
+schema_digest = hashlib.sha256(
+    json.dumps(schemas.containerConfig, sort_keys=True).encode("utf-8")
+).hexdigest()
+
+
+def validate_file(filename):
+    """
+    Parse and validate one container.yaml, returning a list of errors.
+
+    This runs in a worker process, and the validator is compiled once per worker.
+    """
+    try:
+        config = shpc.utils.read_yaml_safe(filename)
+    except Exception as e:
+        return ["Cannot parse yaml: %s" % e]
+    return [
+        "%s: %s" % ("/".join(str(x) for x in error.path) or "(root)", error.message)
+        for error in get_validator().iter_errors(config)
+    ]
+
+
+class RegistryValidator:
+    """
+    Validate the container.yaml files in filesystem registries.
+
+    The hashes of files that passed are saved to the cache (if we have one)
+    so that unchanged files are skipped the next time.
+    """
+
+    def __init__(self, registries, cache_dir=None):
+        self.registries = [reg for reg in registries if reg.is_filesystem_registry]
+        self.path = None
+        if cache_dir:
+            self.path = os.path.join(cache_dir, "validate.json")
+
+    def _load_passed(self):
+        """
+        Load the files that passed, keyed by registry.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            passed = shpc.utils.read_json(self.path)
+        except (OSError, ValueError):
+            return {}
+        if passed.get("schema") != schema_digest:
+            return {}
+        return passed.get("registries", {})
+
+    def _save_passed(self, registries):
+        """
+        Save the files that passed for our registries, keeping the others.
+        """
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with shpc.utils.locked(self.path, os.path.dirname(self.path)):
+                passed = self._load_passed()
+                passed.update(registries)
+                content = json.dumps({"schema": schema_digest, "registries": passed})
+                shpc.utils.write_file(self.path, content, atomic=True)
+        except OSError as e:
+            logger.warning("Cannot save %s: %s" % (self.path, e))
+
+    def validate(self, jobs=1, force=False):
+        """
+        Validate all container.yaml files, and return a report.
+
+        Files with a hash that passed before are skipped unless force is True.
+        With jobs > 1, files are parsed and validated in a process pool.
+        """
+        passed = {} if force else self._load_passed()
+        results = []
+        todo = []
+        for reg in self.registries:
+            for regpath, module in reg.iter_modules():
+                result = {"module": module, "registry": reg.source}
+                filename = os.path.join(regpath, module, "container.yaml")
+                digest = shpc.utils.get_file_hash(filename)
+                result.update({"path": filename, "sha256": digest})
+                results.append(result)
+                if passed.get(reg.source, {}).get(filename) == digest:
+                    result.update({"status": "skipped", "errors": []})
+                else:
+                    todo.append(result)
+
+        filenames = [result["path"] for result in todo]
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                errors = list(executor.map(validate_file, filenames, chunksize=16))
+        else:
+            errors = [validate_file(filename) for filename in filenames]
+
+        for result, errs in zip(todo, errors):
+            result.update({"status": "failed" if errs else "passed", "errors": errs})
+
+        # Only files that pass now are kept as passed
+        passed = {reg.source: {} for reg in self.registries}
+        for result in results:
+            if result["status"] != "failed":
+                passed[result["registry"]][result["path"]] = result["sha256"]
+        self._save_passed(passed)
+        counts = {"passed": 0, "failed": 0, "skipped": 0}
+        for result in results:
+            counts[result["status"]] += 1
+        return {
+            "registries": [reg.source for reg in self.registries],
+            "total": len(results),
+            **counts,
+            "results": results,
+        }
@@ -137,9 +137,17 @@ shells = ["/bin/bash", "/bin/sh", "/bin/csh"]
 settingsProperties = {
     "registry": {"type": "array", "items": {"type": "string"}},
     "sync_registry": {"type": "string"},
+    "registry_cache_ttl": {
+        "oneOf": [
+            {"type": ["integer", "null"]},
+            {"type": "string", "pattern": "^[0-9]+$"},
+        ]
+    },
     "wrapper_base": {"type": ["string", "null"]},
     "module_base": {"type": "string"},
     "container_base": {"type": ["string", "null"]},
+    "cache_base": {"type": ["string", "null"]},
+    "shared_container_caches": {"type": "array", "items": {"type": "string"}},
     "namespace": {"type": ["string", "null"]},
     "singularity_module": {"type": ["string", "null"]},
     "podman_module": {"type": ["string", "null"]},
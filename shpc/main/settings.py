@@ -275,6 +275,20 @@ class SettingsBase:
                 continue
             return path
 
+    @property
+    def cache_dir(self):
+        """
+        Return the directory for shpc caches, defaulting to the user home.
+        """
+        return self.cache_base or defaults.cache_base
+
+    @property
+    def lock_dir(self):
+        """
+        Return the directory for lock files, shared by shpc processes.
+        """
+        return os.path.join(self.module_base, ".shpc-locks")
+
     def ensure_filesystem_registry(self):
         """
         Ensure that the settings has a filesystem registry.
@@ -295,7 +309,7 @@ class SettingsBase:
         """
         Given a value, make substitutions
         """
-        if isinstance(value, bool) or not value:
+        if isinstance(value, (bool, int, float)) or not value:
             return value
 
         # Currently dicts only support boolean or null so we return as is
@@ -4,7 +4,7 @@ __license__ = "MPL 2.0"
 
 
 from . import generators as gen
-from .base import WrapperScript
+from .base import WrapperScript, write_wrappers
 
 
 def generate(image, container, config, **kwargs):
@@ -15,7 +15,7 @@ def generate(image, container, config, **kwargs):
     All kwargs go in optional. The core set of constructor kwargs are provided
     to each wrapper generator. This can be extended to include custom arguments.
     """
-    # Return list of generated templates
+    # Rendered (path, content) of wrappers, written together at the end
     generated = []
 
     settings = container.settings
@@ -40,7 +40,10 @@ def generate(image, container, config, **kwargs):
 
     # Container level wrapper scripts (allow eventually supporting custom podman)
     generated += gen.custom_container_wrappers(constructor_kwargs)
-    return list(set(generated))
+
+    # A later wrapper with the same name replaces an earlier one
+    generated = list(dict(generated).items())
+    return list(set(write_wrappers(generated)))
 
 
 def load_default_wrapper(constructor_kwargs):
@@ -2,6 +2,8 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2021-2024, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+import functools
+import hashlib
 import os
 
 from jinja2 import Environment, FileSystemLoader
@@ -13,6 +15,37 @@ here = os.path.dirname(os.path.abspath(__file__))
 default_templates = os.path.join(here, "templates")
 
 
+@functools.lru_cache(maxsize=None)
+def get_environment(template_paths):
+    """
+    Get the environment for a tuple of template paths, shared in this process.
+
+    The environment keeps the templates it compiled (until a file changes).
+    """
+    return Environment(loader=FileSystemLoader(list(template_paths)))
+
+
+@functools.lru_cache(maxsize=256)
+def compile_string(template_paths, content):
+    """
+    Compile template content (e.g., a script alongside a container.yaml) once.
+    """
+    return get_environment(template_paths).from_string(content)
+
+
+@functools.lru_cache(maxsize=None)
+def get_templates_digest(template_paths):
+    """
+    Get a digest of the files in a tuple of template paths, once per process.
+    """
+    hasher = hashlib.sha256()
+    for template_path in template_paths:
+        for filename in sorted(shpc.utils.recursive_find(template_path)):
+            hasher.update(os.path.relpath(filename, template_path).encode("utf-8"))
+            hasher.update(shpc.utils.get_file_hash(filename).encode("utf-8"))
+    return hasher.hexdigest()
+
+
 class WrapperScript:
     """
     The base class of a wrapper script provides basic wrapper script functionality,
@@ -104,30 +137,26 @@ class WrapperScript:
 
         # This is a dict with either path (filesystem to load) or loaded (content)
         result = self.find_wrapper_script(template_paths, include_container_dir)
-        loader = FileSystemLoader(template_paths)
-        env = Environment(loader=loader)
+        template_paths = tuple(template_paths)
 
         # Do we have a filesystem path to load directly?
         if "path" in result:
+            env = get_environment(template_paths)
             self.template = env.get_template(self.wrapper_template)
 
         # Or string content to load?
         else:
-            self.template = env.from_string(result["content"])
+            self.template = compile_string(template_paths, result["content"])
 
-    def generate(self, wrapper_name, alias_definition=None):
+    def render(self, wrapper_name, alias_definition=None):
         """
-        Template generation function.
+        Render a wrapper script, and return the path to write it to and content.
         NB: alias_definition is a dictionary for command aliases, and a string
         for additional arbitrary commands. It is not required for container
         interaction wrappers (e.g., exec, shell, etc.)
         """
-
-        # Write scripts into custom module directory
-        wrapper_dir = os.path.join(self.wrapper_dir, "bin")
-        shpc.utils.mkdirp([wrapper_dir])
-        wrapper_path = os.path.join(wrapper_dir, wrapper_name)
-
+        # Scripts go into the custom module directory
+        wrapper_path = os.path.join(self.wrapper_dir, "bin", wrapper_name)
         out = self.template.render(
             alias=alias_definition,
             container=self.container,
@@ -137,7 +166,21 @@ class WrapperScript:
             # includes wrapper_dir, features, etc
             **self.kwargs
         )
-        shpc.utils.write_file(wrapper_path, out, exec=True)
+        return wrapper_path, out
+
+    def generate(self, wrapper_name, alias_definition=None):
+        """
+        Template generation function, to render and write one wrapper script.
+        """
+        return write_wrappers([self.render(wrapper_name, alias_definition)])
+
 
-        # Return the alias / script name
-        return [os.path.basename(wrapper_path)]
+def write_wrappers(rendered):
+    """
+    Write rendered wrapper scripts, and return the alias / script names.
+    """
+    for dirname in set(os.path.dirname(path) for path, _ in rendered):
+        shpc.utils.mkdir_p(dirname)
+    for wrapper_path, out in rendered:
+        shpc.utils.write_file(wrapper_path, out, exec=True)
+    return [os.path.basename(wrapper_path) for wrapper_path, _ in rendered]
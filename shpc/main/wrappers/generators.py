@@ -11,7 +11,8 @@ from shpc.logger import logger
 from .base import WrapperScript
 
 # These functions are under the generate namespace, so you can assume
-# they generate the content being referenced
+# they generate the content being referenced. Each returns a list of
+# rendered (wrapper path, content) to write together.
 
 
 def alias_wrappers(aliases, default_wrapper, constructor_kwargs):
@@ -37,7 +38,7 @@ def alias_wrappers(aliases, default_wrapper, constructor_kwargs):
             )
 
         # NB: alias is a dictionary
-        generated += wrapper.generate(alias["name"], alias)
+        generated.append(wrapper.render(alias["name"], alias))
     return generated
 
 
@@ -61,7 +62,7 @@ def custom_container_wrappers(constructor_kwargs):
         # Template wrapper scripts may live alongside container.yaml
         wrapper.load_template(include_container_dir=True)
         # NB: alias is a string
-        generated += wrapper.generate(alias, alias)
+        generated.append(wrapper.render(alias, alias))
     return generated
 
 
@@ -112,5 +113,5 @@ def container_wrappers(constructor_kwargs):
     for script, template_name in template_names.items():
         wrapper = WrapperScript(template_name, **constructor_kwargs)
         wrapper.load_template()
-        generated += wrapper.generate(script)
+        generated.append(wrapper.render(script))
     return generated
@@ -8,7 +8,9 @@
 
 import os
 import shutil
+import time
 
+import shpc.utils
 from shpc.main import get_client
 from shpc.main.registry import GitHub
 
@@ -34,9 +36,12 @@ def init_client(tmpdir, module_sys, container_tech, remote=True):
     modules = os.path.join(tmpdir, "modules")
     containers = os.path.join(tmpdir, "containers")
     views = os.path.join(tmpdir, "views")
+    cache = os.path.join(tmpdir, "cache")
     client.settings.set("module_base", modules)
+    client.settings.set("wrapper_base", modules)
     client.settings.set("container_base", containers)
     client.settings.set("views_base", views)
+    client.settings.set("cache_base", cache)
 
     # If it's not remote, create a temporary filesystem registry
     if not remote:
@@ -50,3 +55,43 @@ def init_client(tmpdir, module_sys, container_tech, remote=True):
     # Reinit views so they are detected in the temporary location
     client.detect_views()
     return client
+
+
+def add_fork_registry(client, tmp_path):
+    """
+    Copy the test registry, with a dinosaur/fork module like dinosaur/salad.
+    """
+    registry_path = os.path.join(str(tmp_path), "registry")
+    shutil.copytree(os.path.join(here, "testdata", "registry"), registry_path)
+
+    # The test recipe has custom wrapper scripts we don't have
+    container_yaml = os.path.join(registry_path, "dinosaur", "salad", "container.yaml")
+    config = shpc.utils.read_yaml(container_yaml)
+    del config["docker_scripts"], config["singularity_scripts"]
+    shpc.utils.write_yaml(config, container_yaml)
+    shutil.copytree(
+        os.path.join(registry_path, "dinosaur", "salad"),
+        os.path.join(registry_path, "dinosaur", "fork"),
+    )
+    config["docker"] = "vanessa/fork"
+    shpc.utils.write_yaml(config, container_yaml.replace("salad", "fork"))
+    client.settings.registry = [registry_path]
+    client.reload_registry()
+
+
+def fake_pull(client, pulls=None, delay=0):
+    """
+    Pull containers for a client by copying the test container.
+
+    Each uri pulled is added to pulls (if provided), and a delay makes the
+    pull slow enough for concurrent installs to overlap.
+    """
+
+    def pull(uri, dest, prefix=None):
+        if pulls is not None:
+            pulls.append(uri)
+        time.sleep(delay)
+        shutil.copyfile(os.path.join(here, "testdata", "salad_latest.sif"), dest)
+        return dest
+
+    client.container.pull = pull
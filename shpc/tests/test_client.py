@@ -7,8 +7,10 @@
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import io
+import json
 import os
 import shutil
+import sys
 from unittest import mock
 
 import pytest
@@ -17,8 +19,10 @@ import shpc.main.modules.views as views
 import shpc.main.registry as registry
 import shpc.utils
 from shpc.client.upgrade import get_latest_version as glv
+from shpc.client.upgrade import plan_upgrades, upgrade_all
+from shpc.main.container.store import ContainerStore
 
-from .helpers import here, init_client
+from .helpers import add_fork_registry, fake_pull, here, init_client
 
 
 @pytest.mark.parametrize(
@@ -1091,3 +1095,464 @@ def test_reinstall_all_software(
         assert client.views[view_name].exists(
             module_bwa_dir
         ), f"Software was not restored to view: {view_name}"
+
+
+@pytest.mark.parametrize("module_sys", ["lmod", "tcl"])
+def test_install_many(tmp_path, module_sys, capsys):
+    """
+    Test installing several modules with parallel pulls.
+    """
+    client = init_client(str(tmp_path), module_sys, "singularity")
+    add_fork_registry(client, tmp_path)
+
+    # Pulls copy the test container, and show prefixed output
+    def registry_pull(module_dir, container_dir, config, tag, prefix=None):
+        print("%spulling %s" % (prefix, config.name))
+        container_path = os.path.join(container_dir, "%s.sif" % config.flatname)
+        shutil.copyfile(
+            os.path.join(here, "testdata", "salad_latest.sif"), container_path
+        )
+        return container_path
+
+    client.container.registry_pull = registry_pull
+    results = client.install_many(
+        ["dinosaur/salad:latest", "dinosaur/fork:latest", "dinosaur/spoon"], jobs=2
+    )
+    assert results == {
+        "dinosaur/salad:latest": "installed",
+        "dinosaur/fork:latest": "installed",
+        "dinosaur/spoon": "failed to load",
+    }
+    for name in "salad", "fork":
+        module_dir = os.path.join(client.settings.module_base, "vanessa", name)
+        assert os.path.exists(os.path.join(module_dir, "latest", client.modulefile))
+    assert "[dinosaur/fork:latest] pulling" in capsys.readouterr().out
+
+    # Options for one install are not silently dropped
+    with pytest.raises(SystemExit):
+        client.install_many(["dinosaur/salad:latest"], keep_path=True)
+
+    # A failed pull is reported, and not pulled again to write the module
+    pulls = []
+
+    def failed_pull(module_dir, container_dir, config, tag, prefix=None):
+        pulls.append(config.name)
+        sys.exit("cannot pull")
+
+    client.container.registry_pull = failed_pull
+    results = client.install_many(["dinosaur/salad:latest"], jobs=2, force=True)
+    assert results == {"dinosaur/salad:latest": "failed to pull"}
+    assert len(pulls) == 1
+
+
+def test_container_store(tmp_path):
+    """
+    Test that modules with the same container digest share one stored file.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    pulls = []
+    fake_pull(client, pulls)
+    client.install("dinosaur/salad:latest")
+    client.install("dinosaur/fork:latest")
+    assert len(pulls) == 1
+
+    # Both container directories link to the one stored file
+    store = client.container.store
+    digests = [
+        shpc.utils.get_file_hash(client.container.get("vanessa/%s:latest" % name))
+        for name in ["salad", "fork"]
+    ]
+    assert len(set(digests)) == 1
+    blobs = list(shpc.utils.recursive_find(store.root, "[.]sif$"))
+    assert len(blobs) == 1
+    assert store.refcount(blobs[0]) == 2
+
+    # The stored file is removed with the last module that uses it
+    client.uninstall("vanessa/salad:latest", force=True)
+    assert os.path.exists(blobs[0])
+    client.uninstall("vanessa/fork:latest", force=True)
+    assert not os.path.exists(blobs[0])
+
+
+def test_shared_container_caches(tmp_path):
+    """
+    Test that containers in a shared cache are used before pulling.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    # The site cache is another container base, with salad in its store
+    site = os.path.join(str(tmp_path), "site")
+    config = client.load_registry_config("dinosaur/salad")
+    key = client.container.store.key(config.latest.digest)
+    site_path = ContainerStore(site).path(key)
+    os.makedirs(os.path.dirname(site_path))
+    shutil.copyfile(os.path.join(here, "testdata", "salad_latest.sif"), site_path)
+    client.settings.shared_container_caches = [site]
+
+    pulls = []
+    fake_pull(client, pulls)
+    client.install("dinosaur/salad:latest")
+    assert not pulls
+    assert os.path.realpath(client.container.get("vanessa/salad:latest")) == site_path
+
+    # The fork has a different digest, so it is pulled
+    fork_yaml = os.path.join(
+        str(tmp_path), "registry", "dinosaur", "fork", "container.yaml"
+    )
+    fork = shpc.utils.read_yaml(fork_yaml)
+    fork["latest"]["latest"] = fork["tags"]["latest"] = "sha256:" + "0" * 64
+    shpc.utils.write_yaml(fork, fork_yaml)
+    client.install("dinosaur/fork:latest")
+    assert len(pulls) == 1
+
+    records = shpc.utils.read_file(
+        os.path.join(client.settings.cache_dir, "shared-containers.jsonl")
+    ).splitlines()
+    results = [json.loads(record) for record in records]
+    assert [x["result"] for x in results] == ["hit", "miss"]
+    assert results[0]["cache"] == site
+    assert results[1]["size"] == os.path.getsize(site_path)
+
+
+def test_staged_install(tmp_path):
+    """
+    Test that an install is written to a staging directory and moved into place.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    fake_pull(client)
+    client.install("dinosaur/salad:latest")
+    module_dir = os.path.join(client.settings.module_base, "vanessa", "salad")
+    module_file = os.path.join(module_dir, "latest", client.modulefile)
+    assert sorted(os.listdir(module_dir)) == [".version", "latest"]
+    with open(module_file) as fd:
+        content = fd.read()
+
+    # A failed install leaves the previous module as it was
+    def install(*args, **kwargs):
+        raise RuntimeError("the module cannot be written")
+
+    client.container.install = install
+    with pytest.raises(RuntimeError):
+        client.install("dinosaur/salad:latest", force=True)
+    assert sorted(os.listdir(module_dir)) == [".version", "latest"]
+    with open(module_file) as fd:
+        assert fd.read() == content
+    assert client.list(return_modules=True) == {"vanessa/salad": {"latest"}}
+
+
+def test_single_flight_pull(tmp_path):
+    """
+    Test that concurrent installs of the same digest pull it once.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    pulls = []
+    fake_pull(client, pulls, delay=0.2)
+    results = client.install_many(
+        ["dinosaur/salad:latest", "dinosaur/fork:latest"], jobs=2
+    )
+    assert set(results.values()) == {"installed"}
+    assert len(pulls) == 1
+    for name in "salad", "fork":
+        assert os.path.exists(client.container.get("vanessa/%s:latest" % name))
+
+
+def test_shared_container_path(tmp_path):
+    """
+    Test that two names for the same container can be installed at once.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    pulls = []
+    fake_pull(client, pulls, delay=0.2)
+    results = client.install_many(["dinosaur/salad", "dinosaur/salad:latest"], jobs=2)
+    assert set(results.values()) == {"installed"}
+    assert len(pulls) == 1
+    store = client.container.store
+    blobs = list(shpc.utils.recursive_find(store.root, "[.]sif$"))
+    assert len(blobs) == 1
+    assert store.refcount(blobs[0]) == 1
+
+
+def test_template_cache(tmp_path):
+    """
+    Test that module templates are compiled once, and the bytecode is cached.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    template = client.template.load("singularity.lua")
+    assert client.template.load("singularity.lua") is template
+    assert os.listdir(os.path.join(client.settings.cache_dir, "templates"))
+
+    # A changed template file is compiled again
+    custom = os.path.join(str(tmp_path), "custom.lua")
+    shpc.utils.write_file(custom, "-- {|module_name|}")
+    assert client.template.load(custom).render(parsed_name={"tool": "salad"}) == (
+        "-- salad"
+    )
+    shpc.utils.write_file(custom, "-- changed {|module_name|}")
+    os.utime(custom, ns=(0, 0))
+    assert client.template.load(custom).render(parsed_name={"tool": "salad"}) == (
+        "-- changed salad"
+    )
+
+    # Templates are compiled for the module name format
+    client.settings.module_name = "{{ parsed_name.tool }}-shpc"
+    assert client.template.load(custom).render(parsed_name={"tool": "salad"}) == (
+        "-- changed salad-shpc"
+    )
+
+
+def test_wrapper_templates_compiled_once(tmp_path):
+    """
+    Test that wrapper templates are shared between installs, and all written.
+    """
+    import shpc.main.wrappers.base as wrappers_base
+
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    fake_pull(client)
+    env = wrappers_base.get_environment((wrappers_base.default_templates,))
+    client.install("dinosaur/salad:latest")
+    template = env.get_template("singularity/shell.sh")
+    client.install("dinosaur/fork:latest")
+    assert env.get_template("singularity/shell.sh") is template
+
+    for name in "salad", "fork":
+        wrapper_bin = os.path.join(
+            client.settings.wrapper_base, "vanessa", name, "latest", "bin"
+        )
+        assert {name + "-shell", name + "-inspect-deffile"}.issubset(
+            os.listdir(wrapper_bin)
+        )
+
+
+def test_install_unchanged(tmp_path):
+    """
+    Test that installing again only writes files that changed.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    fake_pull(client)
+    module = client.get_module("dinosaur/salad:latest")
+    client.install("dinosaur/salad:latest", module=module)
+    assert module.touched > 0
+    module_file = os.path.join(module.module_dir, client.modulefile)
+    st = os.stat(module_file)
+
+    # The same inputs are not rendered again
+    module = client.get_module("dinosaur/salad:latest")
+    client.install("dinosaur/salad:latest", module=module)
+    assert module.touched == 0
+
+    # When rendered again, the directory is replaced, and files with the
+    # same content are linked from the previous one
+    fingerprint_file = os.path.join(module.module_dir, ".shpc-fingerprint")
+    record = shpc.utils.read_json(fingerprint_file)
+    shpc.utils.write_json(dict(record, fingerprint="changed"), fingerprint_file)
+    module = client.get_module("dinosaur/salad:latest")
+    client.install("dinosaur/salad:latest", module=module)
+    assert module.touched == 1
+    assert os.stat(module_file).st_ino == st.st_ino
+    module = client.get_module("dinosaur/salad:latest")
+    client.install("dinosaur/salad:latest", module=module, force=True)
+    assert module.touched == 0
+    assert os.stat(module_file).st_ino == st.st_ino
+    assert os.stat(module_file).st_mtime_ns == st.st_mtime_ns
+
+    # A setting the module is not rendered from does not change it
+    client.settings.set("registry_cache_ttl", 60)
+    module = client.get_module("dinosaur/salad:latest")
+    client.install("dinosaur/salad:latest", module=module)
+    assert module.touched == 0
+
+    # A changed setting renders the module again
+    client.settings.set("environment_file", "99-salad.sh")
+    module = client.get_module("dinosaur/salad:latest")
+    client.install("dinosaur/salad:latest", module=module)
+    assert module.touched > 0
+    assert "99-salad.sh" in os.listdir(module.module_dir)
+    assert "99-shpc.sh" not in os.listdir(module.module_dir)
+    assert sorted(os.listdir(os.path.dirname(module.module_dir))) == [
+        ".version",
+        "latest",
+    ]
+
+
+def test_inventory(tmp_path):
+    """
+    Test that installs, views and uninstalls are recorded in the inventory.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    fake_pull(client)
+    client.install("dinosaur/salad:latest")
+    client.install("dinosaur/fork:latest")
+    assert os.path.exists(client.inventory.path)
+    assert client.list(return_modules=True) == {
+        "vanessa/salad": {"latest"},
+        "vanessa/fork": {"latest"},
+    }
+    record = client.inventory.get("vanessa/salad", "latest")
+    assert record["digest"].startswith("sha256:")
+    assert os.path.exists(record["container"])
+    assert record["modulefile"] == client.modulefile
+    assert client.container.installed_tags("vanessa/fork") == ["latest"]
+
+    view_handler = views.ViewsHandler(
+        settings_file=client.settings.settings_file, module_sys="lmod"
+    )
+    view_handler.create("mpi")
+    client.detect_views()
+    client.view_install("mpi", "dinosaur/salad:latest")
+    assert client.inventory.get("vanessa/salad", "latest")["views"] == ["mpi"]
+
+    # The tree is only walked to rebuild the inventory
+    fork_dir = os.path.join(client.settings.module_base, "vanessa", "fork")
+    shutil.rmtree(fork_dir)
+    assert "vanessa/fork" in client.list(return_modules=True)
+    records = client.inventory.rebuild()
+    assert list(records) == ["vanessa/salad"]
+    assert records["vanessa/salad"]["latest"]["views"] == ["mpi"]
+    assert records["vanessa/salad"]["latest"]["digest"] == record["digest"]
+    assert client.list(return_modules=True) == {"vanessa/salad": {"latest"}}
+
+    view_handler.delete("mpi", force=True)
+    assert client.inventory.get("vanessa/salad", "latest")["views"] == []
+    client.uninstall("vanessa/salad:latest", force=True)
+    assert client.list(return_modules=True) == {}
+
+
+def test_upgrade_all_plan(tmp_path):
+    """
+    Test planning upgrades, and then upgrading outdated software in parallel.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+
+    # An old tag of fork (with the same container), installed as dinosaur/fork
+    container_yaml = os.path.join(
+        str(tmp_path), "registry", "dinosaur", "fork", "container.yaml"
+    )
+    config = shpc.utils.read_yaml(container_yaml)
+    config["tags"]["old"] = config["tags"]["latest"]
+    config["docker"] = "dinosaur/fork"
+    shpc.utils.write_yaml(config, container_yaml)
+    client.reload_registry()
+
+    fake_pull(client)
+    client.install("dinosaur/salad:latest")
+    client.install("dinosaur/fork:old")
+    view_handler = views.ViewsHandler(
+        settings_file=client.settings.settings_file, module_sys="lmod"
+    )
+    view_handler.create("mpi")
+    client.detect_views()
+    client.view_install("mpi", "dinosaur/fork:old")
+
+    # vanessa/salad is installed from dinosaur/salad, so it is not found
+    plan = plan_upgrades(client, ["vanessa/salad", "dinosaur/fork"], jobs=2)
+    assert [entry["outdated"] for entry in plan] == [False, True]
+    assert "error" in plan[0]
+    assert plan[1] == {
+        "name": "dinosaur/fork",
+        "installed": ["old"],
+        "latest": "latest",
+        "outdated": True,
+        "views": ["mpi"],
+    }
+
+    results = upgrade_all(client, [plan[1]], jobs=2, force=True)
+    assert results == {"dinosaur/fork:latest": "installed"}
+    assert client.list(return_modules=True)["dinosaur/fork"] == {"latest"}
+    assert client.inventory.get("dinosaur/fork", "latest")["views"] == ["mpi"]
+    assert client.views["mpi"].symlink_exists(
+        os.path.join(client.settings.module_base, "dinosaur", "fork", "latest")
+    )
+
+
+def test_check_all(tmp_path):
+    """
+    Test checking all installed modules against the registry (and upstream).
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    add_fork_registry(client, tmp_path)
+    container_yaml = os.path.join(
+        str(tmp_path), "registry", "dinosaur", "fork", "container.yaml"
+    )
+    config = shpc.utils.read_yaml(container_yaml)
+    config["tags"]["old"] = config["tags"]["latest"]
+    config["docker"] = "dinosaur/fork"
+    shpc.utils.write_yaml(config, container_yaml)
+    client.reload_registry()
+
+    fake_pull(client)
+    client.install("dinosaur/salad:latest")
+    client.install("dinosaur/fork:old")
+    client.install("dinosaur/fork:latest")
+
+    # Without a fingerprint, the digest comes from the container name
+    module_dir = os.path.join(client.settings.module_base, "dinosaur", "fork", "old")
+    os.remove(os.path.join(module_dir, ".shpc-fingerprint"))
+    records = client.inventory.rebuild()
+    assert records["dinosaur/fork"]["old"]["digest"].startswith("sha256:")
+
+    report = client.check_all(jobs=2)
+    assert report["total"] == 3
+    statuses = {(x["module"], x["tag"]): x["status"] for x in report["results"]}
+    assert statuses == {
+        ("dinosaur/fork", "latest"): "up-to-date",
+        ("dinosaur/fork", "old"): "up-to-date",
+        ("vanessa/salad", "latest"): "unknown",
+    }
+
+    # The registry has a new digest for a tag
+    digest = "sha256:" + "0" * 64
+    config["tags"]["old"] = digest
+    shpc.utils.write_yaml(config, container_yaml)
+    client.reload_registry()
+    out = os.path.join(str(tmp_path), "report.json")
+    report = client.check_all(jobs=2, out=out)
+    assert shpc.utils.read_json(out) == report
+    result = [x for x in report["results"] if x["tag"] == "old"][0]
+    assert result["status"] == "digest-drift"
+    assert result["registry_digest"] == digest
+
+    # Upstream has a new digest for latest
+    with mock.patch(
+        "shpc.main.container.update.docker.DockerImage.digest", return_value=digest
+    ):
+        report = client.check_all(jobs=2, remote=True)
+    result = [x for x in report["results"] if x["tag"] == "latest"][0]
+    assert result["module"] == "dinosaur/fork"
+    assert result["upstream_digest"] == digest
+    assert result["status"] == "digest-drift"
+
+    # A failed upstream lookup cannot be checked
+    with mock.patch(
+        "shpc.main.container.update.docker.DockerImage.digest",
+        side_effect=RuntimeError("offline"),
+    ):
+        report = client.check_all(jobs=2, remote=True)
+    result = [x for x in report["results"] if x["tag"] == "latest"][0]
+    assert result["status"] == "unknown"
+    assert "offline" in result["error"]
+
+    # Without the latest tag installed, there is a newer tag
+    config["tags"]["old"] = config["tags"]["latest"]
+    shpc.utils.write_yaml(config, container_yaml)
+    client.reload_registry()
+    client.uninstall("dinosaur/fork:latest", force=True)
+    report = client.check_all()
+    result = [x for x in report["results"] if x["tag"] == "old"][0]
+    assert result["status"] == "newer-tag"
+    assert report["newer-tag"] == 1
@@ -7,10 +7,15 @@
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import os
+import threading
+import time
+from unittest import mock
 
 import pytest
 
 import shpc.main.container as container
+import shpc.main.container.update as update
+from shpc.main.container.update import docker
 
 here = os.path.dirname(os.path.abspath(__file__))
 root = os.path.dirname(here)
@@ -69,3 +74,108 @@ def test_docker(tmp_path):
     assert result
     cli.delete(result)
     assert not cli.exists(result)
+
+
+def test_inspect_cache(tmp_path):
+    """
+    Test that singularity inspect metadata is cached for an unchanged image.
+    """
+    cli = container.SingularityContainer()
+    cli.settings.cache_base = os.path.join(str(tmp_path), "cache")
+
+    class Client:
+        calls = 0
+
+        def inspect(self, image):
+            Client.calls += 1
+            return {"attributes": {"labels": {"maintainer": "vsoch"}}}
+
+    cli.client = Client()
+    image = os.path.join(str(tmp_path), "container.sif")
+    with open(image, "w") as fd:
+        fd.write("not really a container")
+
+    metadata = cli.inspect(image)
+    assert cli.inspect(image) == metadata
+    assert Client.calls == 1
+
+    # The same file with another name is the same image
+    os.link(image, image + ".link")
+    assert cli.inspect(image + ".link") == metadata
+    assert Client.calls == 1
+
+    # A changed image is inspected again
+    os.utime(image, ns=(0, 0))
+    cli.inspect(image)
+    assert Client.calls == 2
+
+
+def test_sif_inspect(tmp_path):
+    """
+    Test reading inspect metadata from a SIF image without singularity.
+    """
+    from shpc.main.container import sif
+
+    image = os.path.join(here, "testdata", "salad_latest.sif")
+    with sif.SIFImage(image) as reader:
+        assert reader.header["arch"] == "02"
+        names = [x[1] for x in reader.descriptors()]
+    assert "inspect-metadata.json" in names
+
+    metadata = sif.inspect(image)
+    attributes = metadata["attributes"]
+    assert attributes["deffile"] == "bootstrap: docker\nfrom: vanessa/salad"
+    assert (
+        attributes["labels"]["org.label-schema.usage.singularity.deffile.from"]
+        == "vanessa/salad"
+    )
+    assert "/code/salad" in attributes["runscript"]
+
+    # Files that are not SIF images have no metadata
+    for content in ["", "#!/bin/bash\necho hello\n" * 20]:
+        not_sif = os.path.join(str(tmp_path), "not.sif")
+        with open(not_sif, "w") as fd:
+            fd.write(content)
+        assert sif.inspect(not_sif) is None
+
+
+def test_get_container_tags():
+    """
+    Test that tag digests are looked up at once, and returned in order.
+    """
+    running = []
+    concurrent = []
+    lock = threading.Lock()
+
+    def digest(self, tag):
+        with lock:
+            running.append(tag)
+            concurrent.append(len(running))
+        time.sleep(0.05 if tag != "1.0" else 0.1)
+        with lock:
+            running.remove(tag)
+        if tag == "missing":
+            raise ValueError("no such tag")
+        return "sha256:%s" % tag
+
+    tags = ["1.0", "1.1", "missing", "2.0"]
+    with mock.patch.object(docker.DockerImage, "digest", digest):
+        digests = update.get_container_tags("vanessa/salad", tags, jobs=4)
+    assert digests == [
+        {"1.0": "sha256:1.0"},
+        {"1.1": "sha256:1.1"},
+        None,
+        {"2.0": "sha256:2.0"},
+    ]
+    assert max(concurrent) > 1
+
+    # Requests share one session, which retries when rate limited
+    session = docker.get_session()
+    assert docker.get_session() is session
+    retry = session.get_adapter("https://crane.ggcr.dev").max_retries
+    assert 429 in retry.status_forcelist and retry.backoff_factor
+
+    # The connection pool grows with the number of jobs
+    assert docker.get_session(jobs=32) is session
+    adapter = session.get_adapter("https://crane.ggcr.dev")
+    assert adapter._pool_maxsize == 32
@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+# Copyright (C) 2021-2023 Vanessa Sochat.
+
+# This Source Code Form is subject to the terms of the
+# Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import shutil
+
+import pytest
+
+import shpc.main.registry as registry
+import shpc.main.registry.remote as remote
+import shpc.utils
+
+from .helpers import here, init_client
+
+
+def copy_registry(tmp_path):
+    """
+    Copy the test registry to a temporary location we can modify.
+    """
+    registry_path = os.path.join(str(tmp_path), "registry")
+    shutil.copytree(os.path.join(here, "testdata", "registry"), registry_path)
+    return registry_path
+
+
+def test_registry_index(tmp_path):
+    """
+    Test that the registry index is built and refreshed incrementally.
+    """
+    registry_path = copy_registry(tmp_path)
+    cache_dir = os.path.join(str(tmp_path), "cache")
+    reg = registry.Filesystem(registry_path, cache_dir=cache_dir)
+    assert reg.has_index
+
+    assert [x[1] for x in reg.iter_modules()] == ["dinosaur/salad"]
+    assert os.path.exists(reg.index.db_path)
+    assert reg.exists("dinosaur/salad")
+    assert not reg.exists("dinosaur/fork")
+
+    # The indexed config is the same as loading the file
+    result = reg.find("dinosaur/salad")
+    loaded = registry.FilesystemResult("dinosaur/salad", result.package_file)
+    assert result._config == dict(loaded._config)
+    assert not reg.find("dinosaur/fork")
+
+    # Adding a new entry is found by a new index, changes are re-parsed
+    fork = os.path.join(registry_path, "dinosaur", "fork")
+    os.makedirs(fork)
+    shutil.copyfile(result.package_file, os.path.join(fork, "container.yaml"))
+    reg = registry.Filesystem(registry_path, cache_dir=cache_dir)
+    assert [x[1] for x in reg.iter_modules()] == ["dinosaur/fork", "dinosaur/salad"]
+    assert [x.module for x in reg.iter_registry(filter_string="fork")] == [
+        "dinosaur/fork"
+    ]
+
+    config = shpc.utils.read_yaml(os.path.join(fork, "container.yaml"))
+    config["description"] = "A container all about forks."
+    shpc.utils.write_yaml(config, os.path.join(fork, "container.yaml"))
+    assert reg.find("dinosaur/fork")._config["description"] == config["description"]
+
+    # Removed entries are removed from the index
+    shutil.rmtree(fork)
+    reg = registry.Filesystem(registry_path, cache_dir=cache_dir)
+    assert [x[1] for x in reg.iter_modules()] == ["dinosaur/salad"]
+
+
+def test_indexed_result_save(tmp_path):
+    """
+    Saving a result loaded from the index preserves comments.
+    """
+    registry_path = copy_registry(tmp_path)
+    reg = registry.Filesystem(registry_path, cache_dir=str(tmp_path / "cache"))
+    result = reg.find("dinosaur/salad")
+    result._config["description"] = "Salad with forks."
+    result.save(result.package_file)
+
+    content = shpc.utils.read_file(result.package_file)
+    assert "description: Salad with forks." in content
+    assert "# An example of a custom wrapper script" in content
+
+
+class MockResponse:
+    def __init__(self, status_code, library=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(library or {}).encode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def test_remote_library_cache(tmp_path, monkeypatch):
+    """
+    Test the on-disk library cache for a remote registry.
+    """
+    library = {
+        "vanessa/salad": {
+            "config": {"docker": "vanessa/salad"},
+            "config_url": "https://example.com/vanessa/salad/container.yaml",
+        }
+    }
+    requests = []
+
+    def respond(*responses):
+        responses = list(responses)
+
+        def get(url, headers=None, **kwargs):
+            requests.append(headers or {})
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        monkeypatch.setattr(remote.requests, "get", get)
+
+    def get_remote(ttl=0):
+        return registry.GitHub(
+            "https://github.com/singularityhub/shpc-registry",
+            cache_dir=str(tmp_path),
+            cache_ttl=ttl,
+        )
+
+    # The first request saves the library with the etag
+    respond(MockResponse(200, library, {"ETag": '"abc"'}))
+    assert get_remote().find("vanessa/salad")
+    assert requests[-1] == {}
+    assert get_remote().stamp() == '"abc"'
+
+    # Within the ttl we do not make a request
+    assert get_remote(ttl=600).find("vanessa/salad")
+    assert len(requests) == 1
+
+    # Otherwise we revalidate, and a 304 uses the cached library
+    respond(MockResponse(304))
+    assert get_remote().find("vanessa/salad")
+    assert requests[-1] == {"If-None-Match": '"abc"'}
+
+    # A truncated library is fetched again, without the etag
+    library_file = get_remote().library_cache + ".json"
+    shpc.utils.write_file(library_file, '{"vanessa/sal')
+    respond(MockResponse(200, library, {"ETag": '"abc"'}))
+    assert get_remote(ttl=600).find("vanessa/salad")
+    assert requests[-1] == {}
+    assert shpc.utils.read_json(library_file) == library
+
+    # If the remote is not available, the stale library is used
+    respond(remote.requests.exceptions.ConnectionError(), MockResponse(503))
+    assert get_remote().find("vanessa/salad")
+    assert get_remote().find("vanessa/salad")
+
+    # Without a cache, this is an error
+    respond(MockResponse(503))
+    with pytest.raises(SystemExit):
+        registry.GitHub("https://github.com/singularityhub/shpc-registry").find(
+            "vanessa/salad"
+        )
+
+
+def test_registry_lookup(tmp_path, monkeypatch):
+    """
+    Test the merged lookup of module names across registries.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    first = copy_registry(tmp_path / "first")
+    second = copy_registry(tmp_path / "second")
+    fork = os.path.join(second, "dinosaur", "fork")
+    shutil.copytree(os.path.join(second, "dinosaur", "salad"), fork)
+    client.settings.registry = [first, second]
+    client.reload_registry()
+
+    # The first registry wins, and the second is shadowed
+    lookup = client.registry.lookup
+    assert lookup.modules == {"dinosaur/salad": 0, "dinosaur/fork": 1}
+    assert lookup.shadowed == {"dinosaur/salad": [second]}
+    assert client.registry.find("dinosaur/salad").package_file.startswith(first)
+    assert client.registry.find("dinosaur/fork").package_file.startswith(second)
+    assert client.registry.exists("dinosaur/fork") == fork
+    assert os.path.exists(lookup.path)
+
+    # A new client loads the table from the cache
+    client.reload_registry()
+    monkeypatch.setattr(client.registry.lookup, "_build", None)
+    assert client.registry.lookup.modules["dinosaur/fork"] == 1
+
+    # A stale table still finds the module in another registry
+    shutil.rmtree(os.path.join(first, "dinosaur", "salad"))
+    assert client.registry.find("dinosaur/salad").package_file.startswith(second)
+    assert not client.registry.find("dinosaur/spoon")
+
+    # A module added to a higher priority registry is not shadowed by the table
+    shutil.copytree(fork, os.path.join(first, "dinosaur", "fork"))
+    assert client.registry.find("dinosaur/fork").package_file.startswith(first)
+
+    # The table is rebuilt when a registry has a new stamp
+    monkeypatch.setattr(registry.Filesystem, "stamp", lambda self: "changed")
+    client.reload_registry()
+    assert client.registry.lookup.modules["dinosaur/fork"] == 0
+
+    # Invalidating a table that is already gone (e.g., parallel syncs) is fine
+    client.registry.lookup.invalidate()
+    client.registry.lookup.invalidate()
+    assert not os.path.exists(client.registry.lookup.path)
+
+
+def test_registry_search(tmp_path):
+    """
+    Test search and short name resolution across registries.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    registry_path = copy_registry(tmp_path)
+    spoon = os.path.join(registry_path, "cutlery", "spoon")
+    shutil.copytree(os.path.join(registry_path, "dinosaur", "salad"), spoon)
+    config = shpc.utils.read_yaml(os.path.join(spoon, "container.yaml"))
+    config["description"] = "A container to eat soup."
+    config["aliases"] = {"slurp": "/code/slurp"}
+    shpc.utils.write_yaml(config, os.path.join(spoon, "container.yaml"))
+    client.settings.registry = [registry_path]
+    client.reload_registry()
+
+    # The short (tool) name is ranked first
+    assert [x[0] for x in client.registry.search("spoon")] == [
+        "cutlery/spoon",
+        "dinosaur/salad",
+    ]
+    assert [x[0] for x in client.registry.search("slurp")] == ["cutlery/spoon"]
+    assert [x[0] for x in client.registry.search("dino puns")] == ["dinosaur/salad"]
+    assert [x[0] for x in client.registry.search("sou")] == ["cutlery/spoon"]
+    assert client.registry.search("spoon", limit=1)[0][0] == "cutlery/spoon"
+    assert not client.registry.search("fork knife")
+    assert os.path.exists(client.registry.search_index.path)
+
+    # A short name resolves to the full name
+    assert client.registry.resolve("salad") == ["dinosaur/salad"]
+    assert client.resolve_name("spoon") == "cutlery/spoon"
+    assert client.resolve_name("spoon:latest") == "cutlery/spoon:latest"
+    assert client.resolve_name("knife") == "knife"
+
+    # A namespace is used instead of resolving
+    client.settings.set("namespace", "cutlery")
+    assert client.resolve_name("salad") == "salad"
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_registry_validate(tmp_path, jobs):
+    """
+    Test validating a registry, skipping files that passed before.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    registry_path = copy_registry(tmp_path)
+    broken = os.path.join(registry_path, "dinosaur", "broken")
+    os.makedirs(broken)
+    shpc.utils.write_file(os.path.join(broken, "container.yaml"), "docker: 1\n")
+    client.settings.registry = [registry_path]
+    client.reload_registry()
+
+    report = client.registry.validate(jobs=jobs)
+    assert (report["total"], report["passed"], report["failed"]) == (2, 1, 1)
+    result = [x for x in report["results"] if x["module"] == "dinosaur/broken"][0]
+    assert result["status"] == "failed"
+    assert "(root): 'latest' is a required property" in result["errors"]
+
+    # Files that passed are skipped, unless we ask for all
+    report = client.registry.validate(jobs=jobs)
+    assert (report["passed"], report["failed"], report["skipped"]) == (0, 1, 1)
+    report = client.registry.validate(jobs=jobs, force=True)
+    assert (report["passed"], report["failed"], report["skipped"]) == (1, 1, 0)
+
+    # The json report can be saved
+    out = os.path.join(str(tmp_path), "report.json")
+    client.validate(out=out)
+    assert shpc.utils.read_json(out)["failed"] == 1
+
+    # Validating another registry keeps the files that passed in this one
+    client.settings.registry = [copy_registry(tmp_path / "other")]
+    client.reload_registry()
+    assert client.registry.validate(jobs=jobs)["passed"] == 1
+    client.settings.registry = [registry_path]
+    client.reload_registry()
+    assert client.registry.validate(jobs=jobs)["skipped"] == 1
+
+
+def test_registry_show(tmp_path, capsys):
+    """
+    Test streaming show with lazily loaded entries.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    registry_path = copy_registry(tmp_path)
+    fork = os.path.join(registry_path, "dinosaur", "fork")
+    shutil.copytree(os.path.join(registry_path, "dinosaur", "salad"), fork)
+    config = shpc.utils.read_yaml(os.path.join(fork, "container.yaml"))
+    config["docker"] = "vanessa/fork"
+    shpc.utils.write_yaml(config, os.path.join(fork, "container.yaml"))
+    client.settings.registry = [registry_path]
+    client.reload_registry()
+
+    # Entries are not loaded until the config is used
+    entries = list(client.registry.iter_registry())
+    assert all(x._loaded_config is None for x in entries)
+    assert entries[0]._config["docker"] == "vanessa/fork"
+
+    capsys.readouterr()
+    client.show(None, names_only=True)
+    assert capsys.readouterr().out == "vanessa/fork\nvanessa/salad\n"
+    client.show(None, names_only=True, limit=1)
+    assert capsys.readouterr().out == "vanessa/fork\n"
+    client.show(None, filter_string="salad")
+    assert capsys.readouterr().out == "vanessa/salad:latest\n"
+
+    out = os.path.join(str(tmp_path), "show.jsonl")
+    client.show(None, out=out, json_lines=True)
+    lines = [json.loads(x) for x in shpc.utils.read_file(out).splitlines()]
+    assert [x["name"] for x in lines] == ["vanessa/fork", "vanessa/salad"]
+    assert lines[0]["versions"] == ["latest"]
+
+    # The same name is shown with and without versions
+    client.show(None, out=out, names_only=True, json_lines=True)
+    lines = [json.loads(x) for x in shpc.utils.read_file(out).splitlines()]
+    assert [x["name"] for x in lines] == ["vanessa/fork", "vanessa/salad"]
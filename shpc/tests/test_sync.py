@@ -6,7 +6,10 @@
 # Mozilla Public License, v. 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import logging
 import os
+import shutil
+import subprocess
 
 import pytest
 
@@ -133,3 +136,153 @@ def test_remote_upgrade(tmp_path, remote):
 
     client.registry.sync(sync_registry=remote)
     assert list(client.registry.iter_modules())
+
+
+def init_upstream(tmp_path):
+    """
+    Create a git repository (standing in for GitHub) with the test registry.
+    """
+    upstream = os.path.join(tmp_path, "upstream")
+    shutil.copytree(os.path.join(here, "testdata", "registry"), upstream)
+    shpc.utils.write_file(os.path.join(upstream, "dinosaur", "salad", "README.md"), "")
+    shutil.copytree(
+        os.path.join(upstream, "dinosaur", "salad"),
+        os.path.join(upstream, "dinosaur", "fork"),
+    )
+    git = ["git", "-C", upstream, "-c", "user.name=shpc", "-c", "user.email=shpc@"]
+    subprocess.run(git + ["init", "-q", "-b", "main"], check=True)
+    subprocess.run(git + ["config", "uploadpack.allowFilter", "true"], check=True)
+    subprocess.run(git + ["add", "."], check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "registry"], check=True)
+    return upstream, git
+
+
+def get_upstream_remote(client, upstream):
+    remote = registry.GitHub(
+        "https://github.com/singularityhub/shpc-registry",
+        tag="main",
+        cache_dir=client.settings.cache_dir,
+    )
+    remote._url = "file://" + upstream
+    return remote
+
+
+def test_incremental_sync(tmp_path, caplog):
+    """
+    Test sync from a persistent mirror only copies changed files.
+    """
+    caplog.set_level(logging.INFO, logger="shpc.logger")
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    registry_path = os.path.join(tmp_path, "registry")
+    os.makedirs(registry_path)
+    client.settings.registry = [registry_path]
+    client.reload_registry()
+
+    upstream, git = init_upstream(tmp_path)
+
+    def sync(**kwargs):
+        remote = get_upstream_remote(client, upstream)
+        caplog.clear()
+        client.registry.sync_from_remote(remote, local=registry_path, **kwargs)
+        return remote, caplog.text
+
+    # The first sync clones the mirror and adds the module
+    remote, out = sync()
+    assert remote.source == remote.mirror_dir
+
+    # The mirror is updated under a lock shared with other processes
+    mirrors = os.listdir(os.path.dirname(remote.mirror_dir))
+    assert any(x.endswith(".lock") for x in mirrors)
+    container_yaml = os.path.join(registry_path, "dinosaur", "salad", "container.yaml")
+    assert os.path.exists(container_yaml)
+    assert "add    dinosaur/salad/README.md" in out
+
+    # Nothing changed, so there is nothing to do
+    _, out = sync(overwrite=True)
+    assert "There were no upgrades" in out
+
+    # A change upstream is fetched, and only that file is in the plan
+    with open(os.path.join(upstream, "dinosaur", "salad", "container.yaml"), "a") as fd:
+        fd.write("# a new line\n")
+    subprocess.run(git + ["commit", "-q", "-am", "update"], check=True)
+    _, out = sync(overwrite=True, dryrun=True)
+    assert "update dinosaur/salad/container.yaml" in out
+    assert "README.md" not in out
+    assert "# a new line" not in shpc.utils.read_file(container_yaml)
+
+    sync(overwrite=True)
+    assert "# a new line" in shpc.utils.read_file(container_yaml)
+
+
+def test_single_module_sync(tmp_path):
+    """
+    Test that syncing one module only checks out that module.
+    """
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    registry_path = os.path.join(tmp_path, "registry")
+    os.makedirs(registry_path)
+    upstream, _ = init_upstream(tmp_path)
+
+    remote = get_upstream_remote(client, upstream)
+    client.registry.sync_from_remote(remote, "dinosaur/salad", local=registry_path)
+    assert os.path.exists(os.path.join(remote.mirror_dir, "dinosaur", "salad"))
+    assert not os.path.exists(os.path.join(remote.mirror_dir, "dinosaur", "fork"))
+    assert os.listdir(os.path.join(registry_path, "dinosaur")) == ["salad"]
+
+    # A second module is added to the sparse mirror
+    remote = get_upstream_remote(client, upstream)
+    client.registry.sync_from_remote(remote, "dinosaur/fork", local=registry_path)
+    assert os.path.exists(os.path.join(remote.mirror_dir, "dinosaur", "fork"))
+    assert sorted(os.listdir(os.path.join(registry_path, "dinosaur"))) == [
+        "fork",
+        "salad",
+    ]
+
+    # A missing module is not found
+    remote = get_upstream_remote(client, upstream)
+    client.registry.sync_from_remote(remote, "dinosaur/spoon", local=registry_path)
+    assert not os.path.exists(os.path.join(registry_path, "dinosaur", "spoon"))
+
+    # And a sync of everything checks out the entire tree
+    shutil.rmtree(registry_path)
+    os.makedirs(registry_path)
+    remote = get_upstream_remote(client, upstream)
+    client.registry.sync_from_remote(remote, local=registry_path)
+    assert sorted(os.listdir(os.path.join(registry_path, "dinosaur"))) == [
+        "fork",
+        "salad",
+    ]
+
+
+def test_parallel_sync_from_file(tmp_path, caplog):
+    """
+    Test syncing pairs from a config file in parallel.
+    """
+    caplog.set_level(logging.INFO, logger="shpc.logger")
+    client = init_client(str(tmp_path), "lmod", "singularity")
+    upstream, _ = init_upstream(tmp_path)
+
+    # Each remote gets an existing mirror, which fetches from the upstream
+    cfg = {"sync_registry": {}}
+    for name in ["one", "two", "three"]:
+        local = os.path.join(tmp_path, name)
+        os.makedirs(local)
+        remote = "https://github.com/singularityhub/registry-%s" % name
+        mirror_dir = registry.GitHub(
+            remote, cache_dir=client.settings.cache_dir
+        ).mirror_dir
+        subprocess.run(["git", "clone", "-q", upstream, mirror_dir], check=True)
+        cfg["sync_registry"][local] = remote
+    registry_config = os.path.join(tmp_path, "registries.yaml")
+    shpc.utils.write_yaml(cfg, registry_config)
+
+    summary = client.registry.sync(config_file=registry_config, jobs=2)
+    assert len(summary) == 3
+    for local, result in zip(cfg["sync_registry"], summary):
+        assert result == {"added": ["dinosaur/fork", "dinosaur/salad"], "upgraded": []}
+        assert os.path.exists(os.path.join(local, "dinosaur", "fork", "container.yaml"))
+
+    # Output for each pair is together, followed by the summary
+    two = os.path.join(tmp_path, "two")
+    assert "%s <- https://github.com/singularityhub/registry-two" % two in caplog.text
+    assert "2 added, 0 upgraded" in caplog.text.split("Sync summary:")[1]
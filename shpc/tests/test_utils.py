@@ -164,3 +164,102 @@ def test_print_json():
 
     result = print_json({1: 1})
     assert result == '{\n    "1": 1\n}'
+
+
+def test_read_yaml_cached(tmp_path):
+    print("Testing utils.read_yaml_cached")
+    from shpc.utils import read_yaml_cached, write_file
+
+    cache_dir = str(tmp_path / "cache")
+    filename = str(tmp_path / "container.yaml")
+    write_file(filename, "# A comment\ndescription: spoons\ntags:\n  latest: abc\n")
+
+    content = read_yaml_cached(filename, cache_dir)
+    assert content == {"description": "spoons", "tags": {"latest": "abc"}}
+    assert os.path.exists(os.path.join(cache_dir, "yaml"))
+
+    # A cache hit returns the same, a change to the file is picked up
+    assert read_yaml_cached(filename, cache_dir) == content
+    write_file(filename, "description: forks\n")
+    assert read_yaml_cached(filename, cache_dir) == {"description": "forks"}
+
+    # Without a cache directory we still load the file
+    assert read_yaml_cached(filename) == {"description": "forks"}
+
+
+def _try_lock(lock_file, queue):
+    """
+    Try to take a lock file from another process, without waiting.
+    """
+    import fcntl
+
+    fd = os.open(lock_file, os.O_RDWR)
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        queue.put(True)
+    except OSError:
+        queue.put(False)
+    finally:
+        os.close(fd)
+
+
+def test_locked(tmp_path):
+    """
+    Test that a locked path is held against other processes and threads.
+    """
+    import multiprocessing
+    import threading
+
+    from shpc.utils import locked
+
+    lock_dir = str(tmp_path / "locks")
+    path = str(tmp_path / "module")
+    ctx = multiprocessing.get_context("fork")
+
+    def try_lock():
+        queue = ctx.Queue()
+        (lock_file,) = [os.path.join(lock_dir, x) for x in os.listdir(lock_dir)]
+        proc = ctx.Process(target=_try_lock, args=(lock_file, queue))
+        proc.start()
+        proc.join()
+        return queue.get()
+
+    with locked(path, lock_dir):
+        assert not try_lock()
+
+        # The same thread can lock again, and keeps the lock after
+        with locked(path, lock_dir):
+            pass
+        assert not try_lock()
+
+        # Another thread waits for the lock
+        events = []
+
+        def wait():
+            with locked(path, lock_dir):
+                events.append(1)
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        thread.join(0.2)
+        assert not events
+    thread.join()
+    assert events
+
+
+def test_remove_to_base(tmp_path):
+    """
+    Test that removing a path only removes empty parent directories.
+    """
+    from shpc.utils import remove_to_base
+
+    base = str(tmp_path)
+    module_dir = os.path.join(base, "vanessa", "salad", "latest")
+    os.makedirs(module_dir)
+    with open(os.path.join(base, "vanessa", "salad", ".version"), "w") as fd:
+        fd.write("latest")
+    os.makedirs(os.path.join(base, "vanessa", "fork"))
+
+    remove_to_base(module_dir, base)
+    assert not os.path.exists(os.path.join(base, "vanessa", "salad"))
+    assert os.path.exists(os.path.join(base, "vanessa", "fork"))
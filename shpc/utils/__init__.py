@@ -11,12 +11,15 @@ from .fileio import (
     read_file,
     read_json,
     read_yaml,
+    read_yaml_cached,
+    read_yaml_safe,
     recursive_find,
     remove_to_base,
     write_file,
     write_json,
     write_yaml,
 )
+from .lock import locked
 from .terminal import (
     check_install,
     confirm_action,
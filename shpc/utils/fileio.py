@@ -4,7 +4,9 @@ __license__ = "MPL 2.0"
 
 import errno
 import hashlib
+import io
 import json
+import marshal
 import os
 import re
 import shutil
@@ -18,6 +20,10 @@ try:
 except ImportError:
     from ruamel.yaml import YAML
 
+# The process umask, to give atomically written files the usual permissions
+umask = os.umask(0)
+os.umask(umask)
+
 
 def can_be_deleted(path, ignore_files=None):
     """
@@ -81,12 +87,19 @@ def remove_to_base(path, base_path):
     elif os.path.isdir(path):
         shutil.rmtree(path)
 
-    # If directories above it are empty, remove
+    # If directories above it are empty, remove. We only remove empty
+    # directories, in case another process is adding to one
     while path != base_path:
         if os.path.exists(path):
             if not can_be_deleted(path, [".version"]):
                 break
-            shutil.rmtree(path)
+            version_file = os.path.join(path, ".version")
+            if os.path.exists(version_file):
+                os.remove(version_file)
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
         path = os.path.dirname(path)
 
 
@@ -153,14 +166,32 @@ def get_file_hash(image_path, algorithm="sha256"):
     return hasher.hexdigest()
 
 
-def copyfile(source, destination, force=True):
+def copyfile(source, destination, force=True, atomic=False):
     """
     Copy a file from a source to its destination.
+
+    If atomic, copy to a temporary file and rename it, so the destination
+    is never seen partially written (e.g., by another process).
     """
     # Case 1: It's already there, we aren't replacing it :)
     if source == destination and force is False:
         return destination
 
+    if atomic:
+        fd, tmp_file = tempfile.mkstemp(
+            prefix=".%s." % os.path.basename(destination),
+            dir=os.path.dirname(destination),
+        )
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_file)
+            os.chmod(tmp_file, 0o666 & ~umask)
+            os.replace(tmp_file, destination)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        return destination
+
     # Case 2: It's already there, we ARE replacing it :)
     if os.path.exists(destination) and force is True:
         os.remove(destination)
@@ -169,12 +200,35 @@ def copyfile(source, destination, force=True):
     return destination
 
 
-def write_file(filename, content, mode="w", exec=False):
-    """
-    Write content to a filename
-    """
-    with open(filename, mode) as filey:
-        filey.writelines(content)
+def write_file(filename, content, mode="w", exec=False, atomic=False):
+    """
+    Write content to a filename.
+
+    If atomic is True, write to a temporary file in the same directory first
+    and rename it into place, so readers never see a partial file.
+    """
+    if atomic:
+        fd, tmp_file = tempfile.mkstemp(
+            prefix=".%s." % os.path.basename(filename),
+            dir=os.path.dirname(os.path.abspath(filename)),
+        )
+        os.close(fd)
+
+        # mkstemp is private to the user, honor the umask like open would
+        os.chmod(tmp_file, 0o666 & ~umask)
+        try:
+            write_file(tmp_file, content, mode=mode)
+            os.replace(tmp_file, filename)
+        except Exception:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+    else:
+        with open(filename, mode) as filey:
+            if isinstance(content, bytes):
+                filey.write(content)
+            else:
+                filey.writelines(content)
     if exec:
         st = os.stat(filename)
 
@@ -199,13 +253,18 @@ def print_json(json_obj):
     return json.dumps(json_obj, indent=4, separators=(",", ": "))
 
 
-def write_yaml(obj, filename):
+def write_yaml(obj, filename, atomic=False):
     """
     Save yaml to file, also preserving comments.
     """
     yaml = YAML()
     yaml.preserve_quotes = True
 
+    if atomic:
+        stream = io.StringIO()
+        yaml.dump(obj, stream)
+        return write_file(filename, stream.getvalue(), atomic=True)
+
     with open(filename, "w") as fd:
         yaml.dump(obj, fd)
 
@@ -220,6 +279,58 @@ def read_yaml(filename):
     return content
 
 
+def read_yaml_safe(filename):
+    """
+    Load a yaml from file as plain data, without preserving comments.
+
+    This uses the C loader when it is available, and is intended for read only
+    paths where we never write the file back.
+    """
+    yaml = YAML(typ="safe", pure=False)
+    with open(filename, "r") as fd:
+        content = yaml.load(fd.read())
+    return content
+
+
+def read_yaml_cached(filename, cache_dir=None):
+    """
+    Load a yaml from file as plain data, with a serialized cache.
+
+    The cache is keyed on the file path, and invalidated when the inode,
+    modified time, or size change. If the data cannot be serialized (or the
+    cache is not writable) we just return the loaded content.
+    """
+    if not cache_dir:
+        return read_yaml_safe(filename)
+
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    digest = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+    cache_file = os.path.join(cache_dir, "yaml", digest[:2], digest + ".marshal")
+
+    try:
+        with open(cache_file, "rb") as fd:
+            cached_key, content = marshal.load(fd)
+        if tuple(cached_key) == key:
+            return content
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    content = read_yaml_safe(filename)
+    tmp_file = "%s.%s.tmp" % (cache_file, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, "wb") as fd:
+            marshal.dump((key, content), fd)
+        os.replace(tmp_file, cache_file)
+    except (OSError, ValueError):
+        logger.debug("Could not cache parsed %s" % filename)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return content
+
+
 def read_file(filename, mode="r"):
     """
     Read a file.
@@ -0,0 +1,49 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021-2024, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import threading
+
+# Locks held by this process, by lock file path
+_held = {}
+_held_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def locked(path, lock_dir):
+    """
+    Hold an exclusive advisory lock for a path, shared between processes.
+
+    The lock file is named by the path in lock_dir, and not kept in the path
+    itself, so the path can be removed while locked. We use POSIX (fcntl)
+    locks, which work on NFS and Lustre. They are held per process, so
+    threads wait on a lock here, and the same thread can lock a path again.
+    """
+    digest = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()
+    lock_file = os.path.join(lock_dir, "%s.lock" % digest[:32])
+    with _held_lock:
+        held = _held.setdefault(lock_file, {"lock": threading.RLock(), "count": 0})
+
+    with held["lock"]:
+        if not held["count"]:
+            os.makedirs(lock_dir, exist_ok=True)
+            fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            held["fd"] = fd
+        held["count"] += 1
+        try:
+            yield
+        finally:
+            held["count"] -= 1
+
+            # Closing the file releases the lock
+            if not held["count"]:
+                os.close(held.pop("fd"))
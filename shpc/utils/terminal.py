@@ -66,7 +66,7 @@ def get_installdir():
     return os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
 
-def run_command(cmd, sudo=False, stream=False):
+def run_command(cmd, sudo=False, stream=False, prefix=None):
     """run_command uses subprocess to send a command to the terminal.
 
     Parameters
@@ -74,9 +74,10 @@ def run_command(cmd, sudo=False, stream=False):
     cmd: the command to send, should be a list for subprocess
     error_message: the error message to give to user if fails,
     if none specified, will alert that command failed.
+    prefix: when streaming, add this prefix to each line of output
 
     """
-    stdout = PIPE if not stream else None
+    stdout = PIPE if not stream or prefix else None
     if sudo is True:
         cmd = ["sudo"] + cmd
 
@@ -87,6 +88,14 @@ def run_command(cmd, sudo=False, stream=False):
         cmd.pop(0)
         output = Popen(cmd, stderr=STDOUT, stdout=PIPE)
 
+    # Stream lines with a prefix as they come
+    if stream and prefix and output.stdout is not None:
+        for line in iter(output.stdout.readline, b""):
+            print(prefix + line.decode("utf-8", errors="replace"), end="")
+        output.stdout.close()
+        output.wait()
+        return {"message": "", "return_code": output.returncode}
+
     t = output.communicate()[0], output.returncode
     output = {"message": t[0], "return_code": t[1]}
 